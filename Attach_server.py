@@ -4,6 +4,8 @@ import re
 import sys
 import select
 
+import usbip_ports
+
 def list_exported_busids(server_ip):
     subprocess.run(["modprobe", "vhci-hcd"])
     try:
@@ -28,23 +30,23 @@ def attach_all(server_ip, busids):
             subprocess.run(["usbip", "attach", "-r", server_ip, "-b", busid], check=True)
             print(f"[ATTACH] Success: {busid}")
             attached.append(busid)
+            usbip_ports.invalidate()
         except subprocess.CalledProcessError:
             print(f"[ATTACH] Failed: {busid}")
     return attached
 
 def detach_all_ports():
     try:
-        result = subprocess.run(["usbip", "port"], stdout=subprocess.PIPE, universal_newlines=True)
-        ports = re.findall(r"Port (\d+): <Port in Use>", result.stdout)
-        for port in ports:
-            subprocess.run(["usbip", "detach", "-p", port])
-            print(f"[DETACH] Port {port} detached")
+        for r in usbip_ports.in_use_ports() or []:
+            subprocess.run(["usbip", "detach", "-p", r.port])
+            print(f"[DETACH] Port {r.port} detached")
     except Exception as e:
         print(f"[ERROR] Failed to detach: {e}")
+    usbip_ports.invalidate()
 
 def get_current_attached_busids():
-    result = subprocess.run(["usbip", "port"], stdout=subprocess.PIPE, universal_newlines=True)
-    return set(re.findall(r"usbip://.+?/([\d\-\.]+)", result.stdout))
+    """attach 된 bus ID 집합. `usbip port` 가 실패하면 None."""
+    return usbip_ports.attached_busids()
 
 def watchdog_loop(server_ip, initial_busids):
     print(f"[WATCHDOG] Monitoring devices: {initial_busids}")
@@ -63,9 +65,11 @@ def watchdog_loop(server_ip, initial_busids):
                     break
 
             current_attached = get_current_attached_busids()
+            if current_attached is None:
+                print("[WATCHDOG] usbip port failed, skipping re-attach check")
 
             for busid in known_busids.copy():
-                if busid not in current_attached:
+                if current_attached is not None and busid not in current_attached:
                     if retry_counts[busid] >= MAX_RETRIES:
                         print(f"[WATCHDOG] Giving up on {busid}: exceeded retry limit ({MAX_RETRIES})")
                         known_busids.remove(busid)
@@ -80,6 +84,7 @@ def watchdog_loop(server_ip, initial_busids):
                         )
                         print(f"[WATCHDOG] Re-attached: {busid}")
                         retry_counts[busid] = 0
+                        usbip_ports.invalidate()
                     except subprocess.CalledProcessError as e:
                         retry_counts[busid] += 1
                         if "Device busy" in e.stderr:
@@ -100,6 +105,7 @@ def watchdog_loop(server_ip, initial_busids):
                         known_busids.add(busid)
                         retry_counts[busid] = 0
                         print(f"[WATCHDOG] Attached new device: {busid}")
+                        usbip_ports.invalidate()
                     except subprocess.CalledProcessError as e:
                         print(f"[WATCHDOG] Failed to attach new device {busid}: {e}")
 
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import subprocess
+import argparse
 import time
 import re
 import sys
@@ -11,6 +12,18 @@ import glob
 import socket
 import requests
 import signal
+import tempfile
+
+from server_probe import measure_links, format_link, pick_best
+from gpio_discovery import find_board
+from gpio_agent import AgentClient, AgentError, parse_addr
+import trace_replay
+import mode_wait
+import gpio_sequencer
+import remote_async
+import session_state
+import serial_io
+import usbip_ports
 
 # ————— Configuration —————
 DEFAULT_BAUD   = 115200
@@ -33,23 +46,39 @@ USB3FWDN    = ['gpio iomask 8f','gpio writeall 88']
 STR_MODE    = ['gpio iomask c0','gpio writeall c0',
                'gpio writeall 40','gpio writeall c0','gpio writeall 80']
 
+# 메뉴 번호 → (시퀀스, 표시 이름, gpio_agent 모드 이름)
+MODE_MENU = {
+    "1": (POWEROFF,  "Power Off",   "POWEROFF"),
+    "2": (FWDN,      "FWDN Mode",   "FWDN"),
+    "3": (SNOR,      "SNOR Mode",   "SNOR"),
+    "4": (SNOR_EMMC, "SNOR+eMMC",   "SNOR_EMMC"),
+    "5": (EMMC,      "eMMC Mode",   "EMMC"),
+    "6": (SNOR_UFS,  "SNOR+UFS",    "SNOR_UFS"),
+    "7": (UFS,       "UFS Mode",    "UFS"),
+    "8": (USB3FWDN,  "USB3.0 FWDN", "USB3FWDN"),
+    "9": (STR_MODE,  "STR Mode",    "STR_MODE"),
+}
+
+# 다운로드 모드 전환 후 디바이스 등장 대기 (--flash-cmd / --expect 로 설정)
+DOWNLOAD_MODES  = ("FWDN", "USB3FWDN")
+DOWNLOAD_HOOK   = None   # 디바이스가 준비되면 실행할 명령 (예: 플래싱)
+DOWNLOAD_EXPECT = None   # 기다릴 디바이스 ("vid:pid" 또는 "/dev/tty..." glob)
+
+# 모드별 명령 payload (미리 인코딩)
+MODE_PAYLOADS = serial_io.encode_modes({key: seq for seq, _, key in MODE_MENU.values()})
+
 SERVER_IP = None   # 전역으로 선택된 서버 IP 저장
+SESSION   = None   # session_state 에 기록된 현재 세션 (attach 전에 기록, attach 마다 갱신)
 
 def get_attached_devices():
     """
-    현재 `usbip port` 로 붙어 있는 디바이스의 BusID 리스트를 리턴.
+    현재 `usbip port` 로 붙어 있는 디바이스의 BusID 리스트를 리턴 (usbip_ports 스냅샷 공유).
+    `usbip port` 가 실패하면 None (알 수 없음 — 떨어진 것으로 보지 않는다).
     """
-    try:
-        out = subprocess.run(
-            ["usbip","port"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            universal_newlines=True,
-            check=True
-        ).stdout
-        return re.findall(r"usbip://[^/]+/([\d\-\.]+)", out)
-    except:
-        return []
+    records = usbip_ports.snapshot()
+    if records is None:
+        return None
+    return [r.busid for r in records if r.busid]
 
 def get_serial_ports():
     """
@@ -59,15 +88,22 @@ def get_serial_ports():
     return sorted(ports)
 
 # ————— Server List —————
-def select_server(servers):
+def select_server(servers, auto=False):
+    """
+    서버별 free/busy 상태와 링크 품질(RTT, jitter, score)을 보여주고 선택.
+    auto=True 이면 입력 없이 score 가 가장 좋은 free 서버를 고른다.
+    """
     # 1) API에서 할당 현황 불러오기
     try:
         r = requests.get(API_URL, timeout=2)
         r.raise_for_status()
         allocs = r.json().get("data", [])
-    except:
+    except Exception:
         allocs = []
 
+    # 링크 품질 측정 (usbipd 3240 포트 TCP connect RTT, 서버별 병렬)
+    links = measure_links(servers)
+
     # 2) 각 서버별 상태 판정
     statuses = []
     for ip in servers:
@@ -110,9 +146,17 @@ def select_server(servers):
                 info = " ← no exportable devices"
             else:
                 info = ""
-        print(f"  {idx}) {ip} {mark}{info}")
+        print(f"  {idx}) {ip} {mark} [{format_link(links.get(ip))}]{info}")
     print("  0) Exit")
 
+    if auto:
+        best = pick_best(servers, statuses, links)
+        if best is None:
+            print("[AUTO] 사용 가능한 서버가 없습니다.")
+            sys.exit(1)
+        print(f"[AUTO] {best} 선택 ({format_link(links[best])})")
+        return best
+
     # 4) 선택 루프
     while True:
         choice = input(f"Select server [1-{len(servers)}] or 0 to exit: ").strip()
@@ -201,6 +245,8 @@ def attach_all(server_ip, busids):
             )
             usbip_log(f"[ATTACH] Success: {b}")
             attached.append(b)
+            usbip_ports.invalidate()
+            session_state.add_busid(SESSION, b)
         except subprocess.CalledProcessError as e:
             err = (e.stderr or "").lower()
             if "import device" in err:
@@ -211,21 +257,6 @@ def attach_all(server_ip, busids):
             usbip_log(f"[ATTACH] Failed: {b} ({e.stderr.strip()})")
     return attached
 
-def detach_all_ports():
-    try:
-        out = subprocess.run([
-            "usbip","port"
-        ], stdout=subprocess.PIPE,
-            universal_newlines=True
-        ).stdout
-        for p in re.findall(r"Port (\d+): <Port in Use>", out):
-            subprocess.run([
-                "usbip","detach","-p",p
-            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            usbip_log(f"[DETACH] Port {p} detached")
-    except Exception as e:
-        usbip_log(f"[ERROR] Failed detach: {e}")
-
 def watchdog_loop(server_ip, initial_busids):
     usbip_log(f"[WATCHDOG] Monitoring: {initial_busids}")
     known = set(initial_busids)
@@ -233,12 +264,11 @@ def watchdog_loop(server_ip, initial_busids):
     MAX_RETRY = 3
     while True:
         time.sleep(1)
-        outp = subprocess.run([
-            "usbip","port"
-        ], stdout=subprocess.PIPE,
-            universal_newlines=True
-        ).stdout
-        attached_now = set(re.findall(r"usbip://.+?/([\d\-\.]+)", outp))
+        attached_now = get_attached_devices()
+        if attached_now is None:
+            usbip_log("[WATCHDOG] usbip port failed, skipping check")
+            continue
+        attached_now = set(attached_now)
 
         for b in list(known):
             if b not in attached_now:
@@ -255,13 +285,18 @@ def watchdog_loop(server_ip, initial_busids):
                         )
                         usbip_log(f"[WATCHDOG] Re-attached {b}")
                         retries[b] = 0
+                        usbip_ports.invalidate()
                     except subprocess.CalledProcessError:
                         retries[b] += 1
                         usbip_log(f"[WATCHDOG] Re-attach failed for {b} (err #{retries[b]})")
 
         exportable = list_exported_busids(server_ip)
         for b in exportable:
-            if b not in known:
+            if b not in known and SESSION and b in SESSION["busids"]:
+                # mode_wait.import_new 이 이미 attach 해서 세션에 기록한 bus ID
+                known.add(b)
+                retries[b] = 0
+            elif b not in known:
                 usbip_log(f"[WATCHDOG] New exportable detected: {b}")
                 try:
                     subprocess.run([
@@ -270,18 +305,41 @@ def watchdog_loop(server_ip, initial_busids):
                         stderr=subprocess.PIPE, universal_newlines=True, check=True
                     )
                     usbip_log(f"[WATCHDOG] Attached new {b}")
+                    usbip_ports.invalidate()
                     known.add(b)
+                    session_state.add_busid(SESSION, b)
                     retries[b] = 0
                 except subprocess.CalledProcessError as e:
                     usbip_log(f"[WATCHDOG] Failed attach new {b}:\n{e.stderr}")
         time.sleep(DELAY)
 
 # ————— GPIO Control —————
-def run_mode(ser, seq, name):
-    for cmd in seq:
-        ser.write((cmd+"\r").encode())
+def run_mode(ser, seq, name, key=None):
+    """
+    ser 가 AgentClient 면 서버측 gpio_agent 에 모드 이름(key)만 보내 1 RTT 로 처리,
+    gpio_sequencer 에 정의된 모드(STR 등)는 절대 deadline 으로 타이밍을 맞춰 보내고,
+    나머지는 기존처럼 USB/IP 시리얼로 명령을 한 줄씩 보낸다.
+    """
+    if isinstance(ser, AgentClient):
+        t0 = time.monotonic()
+        try:
+            agent_ms = ser.run_mode(key)
+        except AgentError as e:
+            usbip_log(f"[GPIO ERROR] agent: {e}")
+            return
+        total_ms = (time.monotonic() - t0) * 1000.0
+        usbip_log(f"[OK] {name} done via agent ({total_ms:.1f}ms, agent {agent_ms:.1f}ms)")
+        return
+    if key in gpio_sequencer.SEQUENCES:
+        report = gpio_sequencer.run_timed(ser, gpio_sequencer.SEQUENCES[key])
+        usbip_log(gpio_sequencer.format_report(key, report))
+        usbip_log(f"[OK] {name} done")
+        return
+    io = serial_io.get(ser)
+    for data in MODE_PAYLOADS.get(key) or [serial_io.payload(cmd) for cmd in seq]:
+        io.write(data)
         time.sleep(DELAY)
-        ser.read_all()
+        io.discard()
     usbip_log(f"[OK] {name} done")
 
 def find_acm_port():
@@ -289,18 +347,57 @@ def find_acm_port():
     ports.sort()
     return ports[0] if ports else None
 
-def gpio_flow():
-    port = find_acm_port()
+def open_gpio(board_id=None, agent=None):
+    """GPIO 제어 핸들(serial.Serial 또는 AgentClient)을 연다. 실패하면 None."""
+    if agent:
+        host, port = parse_addr(agent)
+        try:
+            ser = AgentClient(host, port).connect()
+            usbip_log(f"[GPIO] agent {host}:{port} connected")
+            return ser
+        except (OSError, AgentError) as e:   # AgentError: 토큰 거절 등
+            usbip_log(f"[GPIO ERROR] agent {host}:{port}: {e}")
+            return None
+
+    baud = DEFAULT_BAUD
+    if board_id:
+        found = find_board(board_id)
+        if not found:
+            usbip_log(f"[GPIO ERROR] Board {board_id} not found")
+            return None
+        port, baud = found
+    else:
+        port = find_acm_port()
     if not port:
         usbip_log("[GPIO ERROR] No ACM port found")
-        return
+        return None
     try:
-        ser = serial.Serial(port, baudrate=DEFAULT_BAUD, timeout=1, write_timeout=1)
-        usbip_log(f"[GPIO] {port}@{DEFAULT_BAUD} connected")
+        ser = serial.Serial(port, baudrate=baud, timeout=1, write_timeout=1, exclusive=True)
+        usbip_log(f"[GPIO] {port}@{baud} connected")
+        return ser
     except Exception as e:
         usbip_log(f"[GPIO ERROR] {e}")
+        return None
+
+def gpio_flow(board_id=None, agent=None):
+    ser = open_gpio(board_id, agent)
+    if ser is None:
         return
+    gpio_menu(ser)
+
+def apply_mode(ser, c):
+    """메뉴 번호 c 의 모드를 실행 (다운로드 모드는 설정 시 디바이스 등장까지 대기)."""
+    seq,name,key = MODE_MENU[c]
+    usbip_log(f"[MODE] {name}")
+    if key in DOWNLOAD_MODES and (DOWNLOAD_HOOK or DOWNLOAD_EXPECT):
+        mode_wait.switch_and_wait(
+            lambda: run_mode(ser, seq, name, key),
+            expect=DOWNLOAD_EXPECT, server_ip=SERVER_IP,
+            hook=DOWNLOAD_HOOK, log=usbip_log, session=SESSION)
+    else:
+        run_mode(ser, seq, name, key)
 
+def gpio_menu(ser):
     while True:
         render_menu()
         try:
@@ -310,21 +407,8 @@ def gpio_flow():
             continue
         if c == "0":
             break
-        mapping = {
-            "1": (POWEROFF, "Power Off"),
-            "2": (FWDN, "FWDN Mode"),
-            "3": (SNOR, "SNOR Mode"),
-            "4": (SNOR_EMMC, "SNOR+eMMC"),
-            "5": (EMMC, "eMMC Mode"),
-            "6": (SNOR_UFS, "SNOR+UFS"),
-            "7": (UFS, "UFS Mode"),
-            "8": (USB3FWDN, "USB3.0 FWDN"),
-            "9": (STR_MODE, "STR Mode")
-        }
-        if c in mapping:
-            seq,name = mapping[c]
-            usbip_log(f"[MODE] {name}")
-            run_mode(ser, seq, name)
+        if c in MODE_MENU:
+            apply_mode(ser, c)
         else:
             usbip_log("[GPIO] Enter 0-9")
 
@@ -348,36 +432,37 @@ def report_to_api(server_ip, api_url=API_URL):
     except Exception as e:
         usbip_log(f"[REPORT] FAIL → {e}")
 
+def shutdown_session():
+    """포트 detach 와 API 할당 해제를 병렬로, TEARDOWN_DEADLINE 안에 끝낸다."""
+    session_state.teardown(SESSION, log=usbip_log)
+
 # ————— Signal Handler —————
 def handle_sigint(signum, frame):
-    usbip_log("[INFO] SIGINT received, cleaning up...")
-    detach_all_ports()
-    try:
-        if not get_serial_ports():
-            detach_all_ports()
-    except Exception as e:
-        usbip_log(f"[ERROR] Failed to detach: {e}")
-
-    client_ip = socket.gethostbyname(socket.gethostname())
-    try:
-        d = requests.delete(f"{API_URL}/{client_ip}", timeout=2)
-        d.raise_for_status()
-        usbip_log(f"[REPORT] DELETE OK → {client_ip}")
-    except Exception as e:
-        usbip_log(f"[REPORT] DELETE FAIL → {e}")
+    usbip_log(f"[INFO] Signal {signum} received, cleaning up...")
+    shutdown_session()
     print("All done. Goodbye!")
     sys.exit(0)
 
 signal.signal(signal.SIGINT, handle_sigint)
+signal.signal(signal.SIGTERM, handle_sigint)
 
 # ————— Main Flow —————
-if __name__ == "__main__":
+def main(args):
+    global SERVER_IP, SESSION, DOWNLOAD_HOOK, DOWNLOAD_EXPECT
+
+    DOWNLOAD_HOOK, DOWNLOAD_EXPECT = args.flash_cmd, args.expect
+    if args.sequences:
+        gpio_sequencer.load_sequences(args.sequences)
+
+    # 이전 실행이 비정상 종료하며 남긴 포트/API 할당 정리
+    session_state.recover_stale(log=usbip_log)
+
     servers = [
         "tcremote.telechips.com",
         "10.10.27.132"
     ]
     # 2) 메뉴로 선택
-    server_ip = select_server(servers)
+    server_ip = select_server(servers, auto=args.auto)
     print(f"→ You selected: {server_ip}")
 
     SERVER_IP = server_ip
@@ -387,6 +472,8 @@ if __name__ == "__main__":
         print("[INFO] No exportable USB devices; exiting.")
         sys.exit(0)
 
+    # attach 전에 상태 파일부터 기록: attach 도중 죽어도 다음 실행이 정리한다
+    SESSION = session_state.save_state(server_ip, [], API_URL, leased=False)
     attached = []
     for i in range(1,6):
         usbip_log(f"[INFO] Attach attempt {i}/5")
@@ -394,39 +481,92 @@ if __name__ == "__main__":
         if attached:
             usbip_log("[INFO] Attach complete. Entering GPIO control.")
             # → 여기서 API에 보고
+            session_state.set_leased(SESSION)
             report_to_api(server_ip)
             break
         time.sleep(DELAY)
     else:
         usbip_log("usbip server의 연결을 실패했습니다.")
+        shutdown_session()
         render_menu()
         sys.exit(1)
 
     time.sleep(2)
+    agent = None
+    if args.transport == "agent":
+        agent = args.agent or server_ip
+
+    if args.use_async:
+        # asyncio 런타임: watchdog / 입력 / GPIO / API / 화면 갱신을 task 로, 종료 시 teardown 까지
+        ser = open_gpio(args.board, agent)
+        if ser is None:
+            shutdown_session()
+            sys.exit(1)
+        remote_async.run(sys.modules[__name__], server_ip, attached, ser)
+        usbip_log("Detached all & exiting")
+        render_menu()
+        print("All done. Goodbye!")
+        return
+
     # Start watchdog thread
-    threading.Thread(target=watchdog_loop, args=(server_ip,attached), daemon=True).start()
+    # trace 기록/재실행은 스레드 이름으로 호출을 나누므로 이름을 고정한다
+    threading.Thread(target=watchdog_loop, args=(server_ip,attached),
+                     name="watchdog", daemon=True).start()
 
     # Initial render before GPIO menu
     render_menu()
 
     time.sleep(1)
     # GPIO menu loop
-    gpio_flow()
+    gpio_flow(args.board, agent)
 
-    # Detach & exit
-    detach_all_ports()
+    # Detach & API 기록 삭제 (병렬, 제한 시간 내)
+    shutdown_session()
     usbip_log("Detached all & exiting")
-    # API 서버에서도 내 기록 삭제
-    client_ip = socket.gethostbyname(socket.gethostname())
-    try:
-        d = requests.delete(f"{API_URL}/{client_ip}", timeout=2)
-        d.raise_for_status()
-        usbip_log(f"[REPORT] DELETE OK → {client_ip}")
-    except Exception as e:
-        usbip_log(f"[REPORT] DELETE FAIL → {e}")
     render_menu()
-
-    # serial port가 남아 있는지 한번 더 점검
-    if not get_serial_ports():
-        detach_all_ports()
     print("All done. Goodbye!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="USB/IP remote GPIO control")
+    parser.add_argument("--auto", action="store_true",
+                        help="select the best free server by link score without prompting")
+    parser.add_argument("--board", metavar="ID",
+                        help="Numato board ID to control (default: first /dev/ttyACM*)")
+    parser.add_argument("--transport", choices=["serial", "agent"], default="serial",
+                        help="send GPIO modes over the USB/IP serial tunnel or to gpio_agent")
+    parser.add_argument("--agent", metavar="HOST[:PORT]",
+                        help="gpio_agent address (default: selected server; token from $GPIO_AGENT_TOKEN)")
+    parser.add_argument("--flash-cmd", metavar="CMD",
+                        help="after FWDN/USB3.0 FWDN, wait for the download device and run CMD "
+                             "(device passed in $MODE_WAIT_DEVICE / $MODE_WAIT_ID)")
+    parser.add_argument("--expect", metavar="VID:PID|/dev/GLOB",
+                        help="device to wait for after FWDN modes (default: any new device)")
+    parser.add_argument("--sequences", metavar="FILE",
+                        help="JSON file of timed GPIO sequences ({name: [[cmd, hold_s], ...]})")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run watchdog, console, GPIO and API as asyncio tasks with timeouts")
+    parser.add_argument("--record", metavar="TRACE",
+                        help="record usbip/serial/API/input calls of this run to TRACE")
+    parser.add_argument("--replay", metavar="TRACE",
+                        help="re-run against a recorded TRACE with a virtual clock (no hardware)")
+    args = parser.parse_args()
+    if args.board and args.transport == "agent":
+        # 에이전트는 서버에서 자기 보드 하나만 구동하므로 보드 선택이 적용되지 않는다
+        parser.error("--board cannot be used with --transport agent "
+                     "(start gpio_agent with --board on the server instead)")
+    if args.use_async and (args.record or args.replay):
+        # asyncio 런타임의 서브프로세스 / stdin reader 는 trace_replay 가 가로채지 않는다
+        parser.error("--async cannot be combined with --record/--replay")
+
+    if args.replay:
+        # 재실행은 실제 세션 상태 파일을 건드리지 않도록 분리
+        session_state.STATE_DIR = tempfile.mkdtemp(prefix="remote_replay_")
+        # 포트 스냅샷 캐시는 시각에 따라 `usbip port` 호출 수가 달라지므로 기록/재실행 모두 끔
+        usbip_ports.disable_cache()
+        sys.exit(trace_replay.replay(args.replay, main, args))
+    elif args.record:
+        usbip_ports.disable_cache()
+        with trace_replay.Recorder(args.record):
+            main(args)
+    else:
+        main(args)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import subprocess
+import argparse
 import time
 import re
 import sys
@@ -7,13 +8,24 @@ import threading
 import os
 import socket
 import signal
+import tempfile
 import serial
 import requests
 
+from server_probe import measure_links, format_link, pick_best
+import slt_results
+from gpio_discovery import find_board
+import session_state
+from gpio_agent import AgentClient, AgentError, parse_addr
+import trace_replay
+import usbip_ports
+import serial_io
+
 # ————— Configuration —————
 DEFAULT_BAUD = 115200
 DELAY        = 0.1
 LOG_FILE     = "Remote_control.txt"
+RESULT_FILE  = "SLT_results_%Y%m%d-%H%M%S.bin"   # 실행마다 새 파일 (strftime 형식)
 API_URL      = "http://10.10.77.137:5001/api/data"
 
 # ON/OFF sequences
@@ -51,24 +63,15 @@ def attach_all(server_ip, busids):
             )
             usbip_log(f"[ATTACH] Success: {b}")
             attached.append(b)
+            usbip_ports.invalidate()
+            session_state.add_busid(SESSION, b)
         except subprocess.CalledProcessError:
             usbip_log(f"[ATTACH] Failed: {b}")
     return attached
 
-def detach_all_ports():
-    try:
-        out = subprocess.run([
-            "usbip","port"
-        ], stdout=subprocess.PIPE,
-            universal_newlines=True
-        ).stdout
-        for p in re.findall(r"Port (\d+): <Port in Use>", out):
-            subprocess.run([
-                "usbip","detach","-p",p
-            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            usbip_log(f"[DETACH] Port {p} detached")
-    except Exception as e:
-        usbip_log(f"[ERROR] Failed detach: {e}")
+def get_attached_busids():
+    """attach 된 bus ID 집합. `usbip port` 가 실패하면 None."""
+    return usbip_ports.attached_busids()
 
 # ————— API Reporting —————
 def report_to_api(server_ip):
@@ -84,33 +87,52 @@ def report_to_api(server_ip):
     except Exception as e:
         usbip_log(f"[REPORT] POST FAIL → {e}")
 
-def delete_from_api():
-    client_ip = socket.gethostbyname(socket.gethostname())
-    try:
-        d = requests.delete(f"{API_URL}/{client_ip}", timeout=2)
-        d.raise_for_status()
-        usbip_log(f"[REPORT] DELETE OK → {client_ip}")
-    except Exception as e:
-        usbip_log(f"[REPORT] DELETE FAIL → {e}")
+# ————— 세션 정리 —————
+SESSION = None   # session_state 에 기록된 현재 세션 (attach 전에 기록, attach 마다 갱신)
 
-# SIGINT 처리: detach + API 삭제
+def shutdown_session():
+    """포트 detach 와 API 할당 해제를 병렬로, 제한 시간 안에 끝낸다."""
+    session_state.teardown(SESSION, log=usbip_log)
+
+# ————— 사이클 결과 기록 —————
+RESULTS = None   # slt_results.ResultStore (main 에서 생성)
+
+def export_results():
+    """이번 실행의 사이클 결과 요약을 결과 파일 옆에 .json / .csv 로 저장."""
+    if RESULTS is None:
+        return
+    base = os.path.splitext(RESULTS.path)[0]
+    RESULTS.export_json(base + ".json")
+    RESULTS.export_csv(base + ".csv")
+    s = RESULTS.summary()
+    usbip_log(f"[RESULT] {s['cycles']} cycles, {s['failed']} failed → {base}.json")
+
+# SIGINT/SIGTERM 처리: detach + API 삭제
 def on_sigint(signum, frame):
     print("\nInterrupted, cleaning up...")
-    detach_all_ports()
-    delete_from_api()
+    export_results()
+    shutdown_session()
     sys.exit(0)
 signal.signal(signal.SIGINT, on_sigint)
+signal.signal(signal.SIGTERM, on_sigint)
 
 # ————— Server 선택 —————
-def select_server(servers):
+def select_server(servers, auto=False):
+    """
+    서버별 free/busy 상태와 링크 품질(RTT, jitter, score)을 보여주고 선택.
+    auto=True 이면 입력 없이 score 가 가장 좋은 free 서버를 고른다.
+    """
     # 1) API에서 할당 현황 불러오기
     try:
         r = requests.get(API_URL, timeout=2)
         r.raise_for_status()
         allocs = r.json().get("data", [])
-    except:
+    except Exception:
         allocs = []
 
+    # 링크 품질 측정 (usbipd 3240 포트 TCP connect RTT, 서버별 병렬)
+    links = measure_links(servers)
+
     # 2) 각 서버별 상태 판정
     statuses = []
     for ip in servers:
@@ -153,9 +175,17 @@ def select_server(servers):
                 info = " ← no exportable devices"
             else:
                 info = ""
-        print(f"  {idx}) {ip} {mark}{info}")
+        print(f"  {idx}) {ip} {mark} [{format_link(links.get(ip))}]{info}")
     print("  0) Exit")
 
+    if auto:
+        best = pick_best(servers, statuses, links)
+        if best is None:
+            print("[AUTO] 사용 가능한 서버가 없습니다.")
+            sys.exit(1)
+        print(f"[AUTO] {best} 선택 ({format_link(links[best])})")
+        return best
+
     # 4) 선택 루프
     while True:
         choice = input(f"Select server [1-{len(servers)}] or 0 to exit: ").strip()
@@ -179,17 +209,38 @@ def select_server(servers):
         print(f"Invalid choice '{choice}'. Enter 0 or 1~{len(servers)}.")
 
 # ————— GPIO 시퀀스 실행 —————
-def run_sequence(ser, seq):
+def run_sequence(ser, seq, key=None):
+    """ser 가 AgentClient 면 서버측 gpio_agent 에 모드 이름(key)만 보낸다."""
+    if isinstance(ser, AgentClient):
+        ser.run_mode(key)
+        return
+    io = serial_io.get(ser)
     for cmd in seq:
-        ser.write((cmd + '\r').encode())
+        io.write(serial_io.payload(cmd))
         time.sleep(DELAY)
-        ser.read_all()
+        io.discard()
+
+def timed_sequence(ser, seq, key=None):
+    """run_sequence 실행 후 (성공 여부, 소요 ms) 리턴. 시리얼 오류는 기록만 하고 계속."""
+    t0 = time.monotonic()
+    try:
+        run_sequence(ser, seq, key)
+        ok = True
+    except (serial.SerialException, OSError, AgentError) as e:
+        usbip_log(f"[GPIO ERROR] {e}")
+        ok = False
+    return ok, (time.monotonic() - t0) * 1000.0
 
 # ————— Main Flow —————
-if __name__ == "__main__":
+def main(args):
+    global SESSION, RESULTS
+
+    # 이전 실행이 비정상 종료하며 남긴 포트/API 할당 정리
+    session_state.recover_stale(log=usbip_log)
+
     # 1) 서버 선택 & USB/IP attach
     servers   = ["tcremote.telechips.com", "10.10.27.132"]
-    server_ip = select_server(servers)
+    server_ip = select_server(servers, auto=args.auto)
     print(f"→ Selected server: {server_ip}")
     usbip_log(f"[INFO] Attaching to {server_ip}")
 
@@ -197,12 +248,16 @@ if __name__ == "__main__":
     if not busids:
         print("No exportable devices; exiting.")
         sys.exit(1)
+    # attach 전에 상태 파일부터 기록: attach 도중 죽어도 다음 실행이 정리한다
+    SESSION = session_state.save_state(server_ip, [], API_URL, leased=False)
     attached = attach_all(server_ip, busids)
     if not attached:
         print("Attach failed; exiting.")
+        shutdown_session()
         sys.exit(1)
 
     # API에 보고
+    session_state.set_leased(SESSION)
     report_to_api(server_ip)
 
     # 2) 반복 횟수 입력
@@ -210,43 +265,133 @@ if __name__ == "__main__":
         cycles = int(input("반복할 ON/OFF 사이클 횟수 입력: ").strip())
     except ValueError:
         print("숫자만 입력하세요.")
-        delete_from_api()
+        shutdown_session()
         sys.exit(1)
 
-    # 3) GPIO 포트 열기
-    GPIO_PORT = "/dev/ttyACM0"
+    # 3) GPIO 포트 열기 (agent 모드면 서버측 gpio_agent 에 연결)
+    GPIO_PORT, gpio_baud = "/dev/ttyACM0", DEFAULT_BAUD
+    if args.transport == "agent":
+        GPIO_PORT = args.agent or server_ip
+    elif args.board:
+        found = find_board(args.board)
+        if not found:
+            print(f"GPIO board {args.board} not found")
+            shutdown_session()
+            sys.exit(1)
+        GPIO_PORT, gpio_baud = found
     try:
-        ser = serial.Serial(GPIO_PORT, DEFAULT_BAUD, timeout=1, write_timeout=1)
+        if args.transport == "agent":
+            ser = AgentClient(*parse_addr(GPIO_PORT)).connect()
+        else:
+            ser = serial.Serial(GPIO_PORT, gpio_baud, timeout=1, write_timeout=1, exclusive=True)
     except Exception as e:
         print(f"Cannot open GPIO port {GPIO_PORT}: {e}")
-        detach_all_ports()
-        delete_from_api()
+        shutdown_session()
         sys.exit(1)
 
     # 4) 초기 1분간 POWER OFF 유지
     print("[INFO] Initial POWER OFF (60s)")
     usbip_log("[MODE] Initial POWER OFF")
-    run_sequence(ser, POWEROFF)
+    ok, _ = timed_sequence(ser, POWEROFF, "POWEROFF")
+    if not ok:
+        # 첫 명령부터 실패하면 (에이전트 거절, 보드 응답 없음) 세션을 정리하고 종료
+        print("Initial POWER OFF failed; exiting.")
+        ser.close()
+        shutdown_session()
+        sys.exit(1)
     time.sleep(60)
 
     # 5) ON/OFF 사이클 반복
-    for i in range(1, cycles + 1):
+    RESULTS = slt_results.ResultStore(args.results, append=args.append)
+    # --append 로 이어 쓰면 사이클 번호도 이어서
+    first = RESULTS.last_cycle + 1
+    for i in range(first, first + cycles):
+        start_ts = time.time()
+
         # Power ON 5분
         print(f"[Cycle {i}] POWER ON (300s)")
         usbip_log(f"[MODE] POWER ON (cycle {i})")
-        run_sequence(ser, SNOR_EMMC)
+        t_on = time.monotonic()
+        on_ok, on_ms = timed_sequence(ser, SNOR_EMMC, "SNOR_EMMC")
         time.sleep(60)
+        busids = get_attached_busids()
+        # `usbip port` 가 실패하면 확인할 수 없으므로 떨어진 것으로 보지 않는다
+        present = busids & set(attached) if busids is not None else set(attached)
+        if busids is None:
+            usbip_log(f"[WARN] usbip port failed, attach state unknown (cycle {i})")
 
         # Power OFF 10초
         print(f"[Cycle {i}] POWER OFF (10s)")
         usbip_log(f"[MODE] POWER OFF (cycle {i})")
-        run_sequence(ser, POWEROFF)
+        t_off = time.monotonic()
+        off_ok, off_ms = timed_sequence(ser, POWEROFF, "POWEROFF")
         time.sleep(10)
+        t_end = time.monotonic()
+
+        if not (on_ok and off_ok):
+            outcome = slt_results.SERIAL_FAIL
+        elif len(present) < len(attached):
+            outcome = slt_results.DETACHED
+        else:
+            outcome = slt_results.OK
+        RESULTS.record(i, start_ts, t_off - t_on, t_end - t_off,
+                       on_ms + off_ms, len(present), outcome)
 
     # 6) 정리 & 종료
     ser.close()
+    export_results()
+    RESULTS.close()
     print("모든 사이클 완료. Detaching...")
     usbip_log("[INFO] All cycles done; detaching")
-    detach_all_ports()
-    delete_from_api()
-    print("끝났습니다. Goodbye!")
\ No newline at end of file
+    shutdown_session()
+    print("끝났습니다. Goodbye!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SLT power ON/OFF cycling over USB/IP")
+    parser.add_argument("--auto", action="store_true",
+                        help="select the best free server by link score without prompting")
+    parser.add_argument("--results",
+                        help=f"per-cycle binary result file (default: new {RESULT_FILE} per run)")
+    parser.add_argument("--append", action="store_true",
+                        help="continue an existing --results file instead of refusing it")
+    parser.add_argument("--board", metavar="ID",
+                        help="Numato board ID to drive (default: /dev/ttyACM0)")
+    parser.add_argument("--transport", choices=["serial", "agent"], default="serial",
+                        help="send GPIO modes over the USB/IP serial tunnel or to gpio_agent")
+    parser.add_argument("--agent", metavar="HOST[:PORT]",
+                        help="gpio_agent address (default: selected server; token from $GPIO_AGENT_TOKEN)")
+    parser.add_argument("--record", metavar="TRACE",
+                        help="record usbip/serial/API/input calls of this run to TRACE")
+    parser.add_argument("--replay", metavar="TRACE",
+                        help="re-run against a recorded TRACE with a virtual clock (no hardware)")
+    args = parser.parse_args()
+    if args.board and args.transport == "agent":
+        # 에이전트는 서버에서 자기 보드 하나만 구동하므로 보드 선택이 적용되지 않는다
+        parser.error("--board cannot be used with --transport agent "
+                     "(start gpio_agent with --board on the server instead)")
+    if args.append and not args.results:
+        parser.error("--append requires --results")
+
+    if args.replay and not args.results:
+        # 재실행 결과는 매번 새로 만든다 (이전 재실행 결과에 이어 쓰지 않도록)
+        args.results = os.path.splitext(args.replay)[0] + "_replay.bin"
+        if os.path.exists(args.results):
+            os.remove(args.results)
+    args.results = args.results or time.strftime(RESULT_FILE)
+    # 사이클을 다 돌고 나서가 아니라 attach 전에 거절
+    if os.path.exists(args.results) and os.path.getsize(args.results) and not args.append:
+        parser.error(f"{args.results} already has results; use --append to continue it "
+                     "or choose another --results file")
+
+    if args.replay:
+        # 재실행은 실제 세션 상태/결과 파일을 건드리지 않도록 분리
+        session_state.STATE_DIR = tempfile.mkdtemp(prefix="slt_replay_")
+        # 포트 스냅샷 캐시는 시각에 따라 `usbip port` 호출 수가 달라지므로 기록/재실행 모두 끔
+        usbip_ports.disable_cache()
+        sys.exit(trace_replay.replay(args.replay, main, args))
+    elif args.record:
+        usbip_ports.disable_cache()
+        with trace_replay.Recorder(args.record):
+            main(args)
+    else:
+        main(args)
@@ -0,0 +1,624 @@
+#!/usr/bin/env python3
+"""
+여러 보드 세션(서버 + GPIO 보드 + 모드 계획)을 한 프로세스에서 실행하는 fleet 컨트롤러.
+
+좌석마다 Remote_control.py 를 따로 띄우는 대신 설정 파일의 세션들을 워커 풀에서
+동시에 돌린다. 서버는 API 할당 현황과 링크 점수(server_probe)로 free 서버를 골라
+배정하고, 실행 중 서버가 떨어지면 (GPIO 보드 재attach 실패, 다시 열어도 보드 응답 없음)
+세션을 다른 free 서버로 옮겨 같은 사이클/스텝부터 이어 간다. 전체 진행 상황은 하나의
+상태 화면과 상태 JSON 파일(--show 로 다른 터미널에서 확인)로 모아 보여 준다.
+
+설정 (JSON):
+  {
+    "api_url":  "http://10.10.77.137:5001/api/data",
+    "servers":  ["tcremote.telechips.com", "10.10.27.132"],
+    "workers":  4,
+    "sessions": [
+      {"name": "seat1", "server": "10.10.27.132", "board": "00000001",
+       "plan": [["SNOR_EMMC", 60], ["POWEROFF", 10]], "cycles": 100},
+      {"name": "seat2", "plan": [["STR_MODE", 30], ["POWEROFF", 10]],
+       "transport": "agent"}
+    ]
+  }
+  server    : 고정 서버 (생략하면 free 서버 중 자동 배정, 떨어지면 다른 서버로 이동)
+  board     : Numato 보드 ID (생략하면 세션 서버에서 attach 된 첫 Numato 보드, serial 전용)
+  plan      : [모드, 유지 초] 의 나열. 모드 이름은 gpio_agent.MODES 또는 --sequences 의 이름
+  cycles    : plan 반복 횟수 (0 또는 생략하면 중지할 때까지)
+  transport : "serial" (USB/IP 시리얼, 기본) 또는 "agent" (서버의 gpio_agent,
+              토큰은 $GPIO_AGENT_TOKEN)
+
+API 할당:
+  할당 API 는 source_ip 당 기록 하나로 동작한다고 가정한다 (해제가 DELETE /<source_ip>).
+  그래서 세션마다 "<client_ip>-<세션 이름>" 을 source_ip 로 POST 하고, 세션이 서버를
+  옮기거나 끝나면 그 이름으로 DELETE 한다. 이 이름들만 fleet 자신의 할당으로 보고,
+  같은 호스트의 Remote_control / SLT 가 client_ip 로 잡은 서버는 점유로 본다. 제약:
+  - 다른 좌석의 서버 목록에는 점유자가 IP 가 아니라 이 이름으로 보인다.
+  - API 가 source_ip 를 IP 형식으로만 받는다면 POST 가 실패한다 ([REPORT] POST FAIL 로그).
+    그 경우 할당이 보고되지 않으므로 다른 좌석이 같은 서버를 고를 수 있다.
+"""
+import argparse
+import glob
+import json
+import os
+import signal
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+import serial
+
+import gpio_agent
+import gpio_discovery
+import gpio_sequencer
+import mode_wait
+import serial_io
+import session_state
+import usbip_ports
+from server_probe import measure_links, format_link, pick_best
+
+# ————— Configuration —————
+API_URL        = "http://10.10.77.137:5001/api/data"
+WORKERS        = 4       # 동시에 실행하는 세션 수
+STATUS_PERIOD  = 10.0    # 서버 상태 (API 할당, exportable, 링크) 재사용 시간 (초)
+RETRY_PERIOD   = 5.0     # free 서버가 없을 때 다시 배정을 시도하는 주기 (초)
+HEALTH_PERIOD  = 1.0     # 모드 유지 중 디바이스 확인 주기 (초)
+DROP_COOLDOWN  = 60.0    # 떨어진 서버를 다시 배정하지 않는 시간 (초)
+MAX_RECONNECT  = 3       # 스텝이 성공하지 못한 채 보드를 다시 여는 횟수 한도 (넘으면 서버 이동)
+SETTLE_TIMEOUT = 5.0     # attach 후 보드 tty 가 생길 때까지 대기 (초)
+ATTACH_TIMEOUT = 10.0
+SCREEN_PERIOD  = 2.0     # 상태 화면 갱신 주기 (초)
+STATUS_FILE    = "fleet_status.json"
+LOG_FILE       = "fleet.txt"
+
+# ————— Logging —————
+_log_lock = threading.Lock()
+
+def fleet_log(msg: str):
+    """여러 워커가 같이 쓰므로 락을 잡고, 각 줄에 타임스탬프를 붙여 저장."""
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+    with _log_lock, open(LOG_FILE, 'a', encoding='utf-8') as f:
+        for line in msg.splitlines():
+            f.write(f"{timestamp} {line}\n")
+
+class ServerDropped(Exception):
+    """세션 서버의 USB/IP 디바이스나 GPIO 보드가 사라짐 → 다른 서버로 재배정."""
+
+class Reconnect(Exception):
+    """보드를 다시 attach 했거나 GPIO 호출이 실패함 → 같은 서버에서 보드를 다시 연다."""
+
+# ————— Session —————
+class Session:
+    """설정 파일의 세션 하나와 그 진행 상태."""
+    def __init__(self, cfg):
+        self.name      = cfg["name"]
+        self.pinned    = cfg.get("server")
+        self.board     = cfg.get("board")
+        self.plan      = [(mode, float(hold)) for mode, hold in cfg["plan"]]
+        self.cycles    = int(cfg.get("cycles", 0))
+        self.transport = cfg.get("transport", "serial")
+        unknown = [m for m, _ in self.plan
+                   if m not in gpio_agent.MODES and m not in gpio_sequencer.SEQUENCES]
+        if not self.plan or unknown:
+            raise ValueError(f"session {self.name}: bad plan (unknown modes {unknown})")
+        if self.transport not in ("serial", "agent"):
+            raise ValueError(f"session {self.name}: bad transport {self.transport}")
+        if self.board and self.transport == "agent":
+            raise ValueError(f"session {self.name}: board is not supported with the agent "
+                             "transport (the server's gpio_agent picks its own board)")
+
+        self.state      = "queued"
+        self.server     = None
+        self.busids     = []
+        self.board_busid = None   # 보드 tty 가 붙은 bus ID (agent 는 None)
+        self.lost       = []      # 지금 빠져 있는 보드 외 디바이스 (로그 중복 방지)
+        self.reconnects = 0       # 마지막으로 스텝이 성공한 뒤 보드를 다시 연 횟수
+        self.device     = None    # 보드 tty 또는 agent 주소
+        self.step       = 0
+        self.mode       = None
+        self.done       = 0       # 끝난 사이클 수
+        self.moves      = 0       # 서버가 떨어져 옮긴 횟수
+        self.errors     = 0
+        self.last_error = None
+        self.busy_s     = 0.0     # 서버를 점유하고 있던 누적 시간
+        self._lease_t0  = None
+
+    def finished(self):
+        return bool(self.cycles) and self.done >= self.cycles
+
+    def row(self):
+        busy = self.busy_s
+        if self._lease_t0 is not None:
+            busy += time.monotonic() - self._lease_t0
+        return {
+            "name":       self.name,
+            "state":      self.state,
+            "server":     self.server,
+            "device":     self.device,
+            "cycle":      self.done + (0 if self.finished() else 1),
+            "cycles":     self.cycles,
+            "step":       self.step,
+            "mode":       self.mode,
+            "moves":      self.moves,
+            "errors":     self.errors,
+            "last_error": self.last_error,
+            "busy_s":     round(busy, 1),
+        }
+
+def _board_ttys(server, busids):
+    """
+    이 서버에서 attach 한 bus ID 들의 로컬 tty (sysfs 의 인터페이스 아래 tty 노드).
+    리턴: [(tty, 서버측 bus ID)]
+    """
+    ttys = []
+    for r in usbip_ports.snapshot() or ():
+        if r.busid not in busids or not r.local_busid:
+            continue
+        if not session_state.same_host(r.server, server):
+            continue
+        base = os.path.join(mode_wait.SYSFS_USB, r.local_busid + ":*")
+        for p in glob.glob(os.path.join(base, "tty", "tty*")) + glob.glob(os.path.join(base, "ttyUSB*")):
+            ttys.append(("/dev/" + os.path.basename(p), r.busid))
+    return sorted(ttys)
+
+# ————— Fleet —————
+class Fleet:
+    def __init__(self, config, log=fleet_log):
+        self.api_url  = config.get("api_url", API_URL)
+        self.sessions = [Session(c) for c in config["sessions"]]
+        names = [s.name for s in self.sessions]
+        if len(set(names)) != len(names):
+            raise ValueError("duplicate session names")
+        # 고정 서버도 배정 후보에 포함
+        self.servers  = list(dict.fromkeys(list(config.get("servers", [])) +
+                                           [s.pinned for s in self.sessions if s.pinned]))
+        self.workers  = int(config.get("workers", WORKERS))
+        self.log      = log
+        self.stop     = threading.Event()
+        self.lock     = threading.Lock()
+        self.leases   = {}     # server → 세션 이름
+        self.dropped  = {}     # server → 다시 배정 가능해지는 monotonic 시각
+        self.links    = {}
+        self._status  = None   # (monotonic 시각, {server: (free, holders, has_devices)})
+        self.client_ip = socket.gethostbyname(socket.gethostname())
+        self.started  = time.monotonic()
+        self.state    = None   # session_state 기록 (비정상 종료 시 다음 실행이 정리)
+        self._state_lock = threading.Lock()   # 상태 파일 쓰기 순서 보장
+
+    # ——— 서버 배정 ———
+    def lease_id(self, name):
+        """세션의 API 할당 source_ip (모듈 설명의 "API 할당" 참고)."""
+        return f"{self.client_ip}-{name}"
+
+    def server_status(self):
+        """
+        서버별 (free, holders, has_devices). select_server 와 같은 기준이지만
+        이 fleet 의 세션 이름(lease_id)으로 잡힌 API 할당은 점유로 보지 않는다
+        (fleet 내부 배정은 leases 로 관리). 내 IP 로 잡힌 할당은 같은 호스트의 다른
+        스크립트 것이므로 점유로 본다 (죽은 스크립트의 것은 recover_stale 이 정리).
+        """
+        with self.lock:
+            cached = self._status
+        if cached and time.monotonic() - cached[0] < STATUS_PERIOD:
+            return cached[1]
+        try:
+            r = requests.get(self.api_url, timeout=2)
+            r.raise_for_status()
+            allocs = r.json().get("data", [])
+        except Exception:
+            allocs = []
+
+        exportable = {}
+        def worker(ip):
+            exportable[ip] = mode_wait.exportable_busids(ip)
+        threads = [threading.Thread(target=worker, args=(ip,), daemon=True) for ip in self.servers]
+        for t in threads:
+            t.start()
+        links = measure_links(self.servers)
+        for t in threads:
+            t.join()
+
+        own = {self.lease_id(s.name) for s in self.sessions}
+        status = {}
+        for ip in self.servers:
+            holders = [a.get("source_ip") for a in allocs
+                       if a.get("value") == ip and a.get("source_ip") not in own]
+            has_devices = bool(exportable.get(ip))
+            status[ip] = (has_devices and not holders, holders, has_devices)
+        with self.lock:
+            self.links = links
+            self._status = (time.monotonic(), status)
+        return status
+
+    def acquire(self, s):
+        """세션에 free 서버를 하나 배정하고 API 에 보고. 후보가 없으면 None."""
+        status = self.server_status()
+        now = time.monotonic()
+        with self.lock:
+            cands = [ip for ip in self.servers
+                     if ip not in self.leases and self.dropped.get(ip, 0) <= now
+                     and (s.pinned is None or ip == s.pinned)]
+            best = pick_best(cands, [status[ip] for ip in cands], self.links)
+            if best is None:
+                return None
+            self.leases[best] = s.name
+            link = self.links.get(best)
+        s.server, s._lease_t0 = best, time.monotonic()
+        self.log(f"[FLEET] {s.name} → {best} ({format_link(link)})")
+        self._save_state()      # POST 전에 기록: 보고 도중 죽어도 다음 실행이 DELETE
+        self.report(s, best)
+        return best
+
+    def release(self, s, dropped=False):
+        if s.server is None:
+            return
+        with self.lock:
+            self.leases.pop(s.server, None)
+            if dropped:
+                self.dropped[s.server] = time.monotonic() + DROP_COOLDOWN
+                self._status = None     # 다음 배정 때 상태를 새로 확인
+        if s._lease_t0 is not None:
+            s.busy_s += time.monotonic() - s._lease_t0
+        s.server, s._lease_t0, s.busids, s.device = None, None, [], None
+        s.board_busid, s.lost, s.reconnects = None, [], 0
+        self.unreport(s)
+        self._save_state()
+
+    def report(self, s, server_ip):
+        payload = {
+            "source_ip": self.lease_id(s.name),
+            "value":     server_ip,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+        try:
+            requests.post(self.api_url, json=payload, timeout=2).raise_for_status()
+            self.log(f"[REPORT] POST OK → {payload}")
+        except Exception as e:
+            self.log(f"[REPORT] POST FAIL → {e}")
+
+    def unreport(self, s):
+        """세션의 API 할당 해제 (서버 이동/세션 종료 시)."""
+        lease_id = self.lease_id(s.name)
+        try:
+            requests.delete(f"{self.api_url}/{quote(lease_id, safe='')}",
+                            timeout=2).raise_for_status()
+            self.log(f"[REPORT] DELETE OK → {lease_id}")
+        except Exception as e:
+            self.log(f"[REPORT] DELETE FAIL → {e}")
+
+    def _save_state(self):
+        # 워커 스레드들이 동시에 부르므로 계산 + 쓰기를 한 번에 하나씩 (마지막 쓰기가 최신)
+        with self._state_lock:
+            with self.lock:
+                servers = sorted(self.leases)
+                lease_ids = sorted(self.lease_id(name) for name in self.leases.values())
+            busids = [b for s in self.sessions for b in s.busids]
+            self.state = session_state.save_state(servers, busids, self.api_url,
+                                                  leased=bool(lease_ids), lease_ids=lease_ids)
+
+    # ——— USB/IP ———
+    def attach(self, s):
+        attached = []
+        for b in mode_wait.exportable_busids(s.server):
+            try:
+                subprocess.run(
+                    ["usbip","attach","-r",s.server,"-b",b],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                    universal_newlines=True, timeout=ATTACH_TIMEOUT, check=True
+                )
+                self.log(f"[ATTACH] {s.name}: {s.server}/{b}")
+                attached.append(b)
+            except subprocess.CalledProcessError as e:
+                self.log(f"[ATTACH] {s.name}: {s.server}/{b} failed ({(e.stderr or '').strip()})")
+            except (subprocess.TimeoutExpired, OSError) as e:
+                self.log(f"[ATTACH] {s.name}: {s.server}/{b} failed ({e})")
+        usbip_ports.invalidate()
+        return attached
+
+    def detach(self, s):
+        ports = usbip_ports.in_use_ports()
+        if ports is None:
+            self.log(f"[DETACH] {s.name}: usbip port failed, nothing detached")
+            ports = []
+        for r in ports:
+            if r.busid in s.busids and session_state.same_host(r.server, s.server):
+                try:
+                    subprocess.run(["usbip","detach","-p",r.port],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                   timeout=ATTACH_TIMEOUT)
+                    self.log(f"[DETACH] {s.name}: port {r.port} ({s.server}/{r.busid})")
+                except (subprocess.TimeoutExpired, OSError) as e:
+                    self.log(f"[DETACH] {s.name}: port {r.port} failed: {e}")
+        usbip_ports.invalidate()
+
+    def check(self, s):
+        """
+        보드(GPIO) 디바이스가 아직 붙어 있는지 확인. 떨어졌으면 한 번 재attach 해서
+        Reconnect (새 tty 로 다시 열어야 함), 재attach 가 실패하면 ServerDropped.
+        타깃 보드의 USB 디바이스는 POWEROFF / 모드 전환 때 사라지는 게 정상이므로 로그만 남긴다.
+        """
+        records = usbip_ports.snapshot()
+        if records is None:
+            # `usbip port` 실패/시간 초과는 "떨어짐" 이 아니라 "알 수 없음": 이번 확인은 건너뛴다
+            self.log(f"[FLEET] {s.name}: usbip port failed, skipping health check")
+            return
+        present = {r.busid for r in records
+                   if session_state.same_host(r.server, s.server)}
+        lost = [b for b in s.busids if b not in present and b != s.board_busid]
+        if lost != s.lost:
+            self.log(f"[FLEET] {s.name}: devices {lost} not attached on {s.server}" if lost
+                     else f"[FLEET] {s.name}: all devices back on {s.server}")
+            s.lost = lost
+        b = s.board_busid
+        if b is None or b in present:
+            return
+        self.log(f"[FLEET] {s.name}: lost board {b} on {s.server}, re-attaching")
+        try:
+            subprocess.run(["usbip","attach","-r",s.server,"-b",b],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                           timeout=ATTACH_TIMEOUT, check=True)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+            raise ServerDropped(f"{s.server}/{b} re-attach failed")
+        finally:
+            usbip_ports.invalidate()
+        raise Reconnect(f"board {b} re-attached")
+
+    # ——— GPIO ———
+    def connect(self, s):
+        """
+        attach 후 세션 보드에 연결 (Reconnect 로 다시 여는 경우 attach 는 생략).
+        리턴: serial.Serial 또는 gpio_agent.AgentClient
+        """
+        if not s.busids:
+            s.state = "attaching"
+            s.busids = self.attach(s)
+            self._save_state()
+            if not s.busids:
+                raise ServerDropped(f"{s.server}: nothing attached")
+        s.state = "connecting"
+
+        if s.transport == "agent":
+            client = gpio_agent.AgentClient(s.server)
+            try:
+                client.run_mode("PING")
+            except gpio_agent.AgentError as e:
+                raise ServerDropped(f"{s.server}: agent {e}")
+            s.device = f"agent {s.server}:{gpio_agent.AGENT_PORT}"
+            return client
+
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        probed = set()
+        while time.monotonic() < deadline and not self.stop.is_set():
+            for tty, busid in _board_ttys(s.server, s.busids):
+                if tty in probed:
+                    continue
+                probed.add(tty)
+                info = gpio_discovery.probe_port(tty)
+                if info and (s.board is None or info["id"] == s.board):
+                    s.device = f"{tty} ({info['id']})"
+                    s.board_busid = busid
+                    return serial.Serial(tty, baudrate=info["baud"], timeout=0.05, write_timeout=1,
+                                         exclusive=True)
+            time.sleep(0.2)
+        raise ServerDropped(f"{s.server}: board {s.board or '(any)'} not found")
+
+    def apply(self, dev, key):
+        if isinstance(dev, gpio_agent.AgentClient):
+            dev.run_mode(key)
+        elif key in gpio_sequencer.SEQUENCES:
+            gpio_sequencer.run_timed(dev, gpio_sequencer.SEQUENCES[key])
+        else:
+            io = serial_io.get(dev)
+            io.reset()
+            for cmd, data in zip(gpio_agent.MODES[key], gpio_agent.MODE_PAYLOADS[key]):
+                if io.exchange(data) < 0:
+                    raise gpio_agent.AgentError(f"no prompt after '{cmd}'")
+                time.sleep(gpio_agent.HOLD)
+
+    def hold(self, s, seconds):
+        """
+        모드 유지 시간 동안 HEALTH_PERIOD 마다 디바이스를 확인. 중지 요청이면 False.
+        보드를 다시 attach 하면 Reconnect (이 스텝은 다시 연결한 뒤 처음부터).
+        """
+        end = time.monotonic() + seconds
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return True
+            if self.stop.wait(min(remaining, HEALTH_PERIOD)):
+                return False
+            self.check(s)
+
+    def run_plan(self, s, dev):
+        while not self.stop.is_set() and not s.finished():
+            while s.step < len(s.plan):
+                key, hold = s.plan[s.step]
+                s.state, s.mode = "running", key
+                try:
+                    self.apply(dev, key)
+                except (gpio_agent.AgentError, serial.SerialException, OSError) as e:
+                    s.errors += 1
+                    s.last_error = str(e)
+                    self.log(f"[GPIO ERROR] {s.name}: {key} {e}")
+                    # 보드가 떨어졌으면 여기서 재attach (실패면 ServerDropped).
+                    # 어느 쪽이든 기존 fd 는 못 쓰므로 보드를 다시 열고 이 스텝부터
+                    self.check(s)
+                    raise Reconnect(f"{key}: {e}")
+                s.reconnects = 0
+                if not self.hold(s, hold):
+                    return
+                s.step += 1
+            s.step = 0
+            s.done += 1
+            self.log(f"[FLEET] {s.name}: cycle {s.done}{'/' + str(s.cycles) if s.cycles else ''} done")
+
+    # ——— Worker ———
+    def run_session(self, s):
+        """워커 스레드 하나에서 세션을 끝까지 (또는 중지될 때까지) 실행."""
+        try:
+            while not self.stop.is_set() and not s.finished():
+                if s.server is None:
+                    s.state = "waiting"
+                    if self.acquire(s) is None:
+                        self.stop.wait(RETRY_PERIOD)
+                        continue
+                dev = None
+                try:
+                    dev = self.connect(s)
+                    self.run_plan(s, dev)
+                except Reconnect as e:
+                    # 서버는 그대로 두고 (finally 에서 닫은 뒤) 다음 루프에서 보드만 다시 연다
+                    s.reconnects += 1
+                    s.state = "reconnecting"
+                    if s.reconnects <= MAX_RECONNECT:
+                        self.log(f"[FLEET] {s.name}: {e}, reconnecting (#{s.reconnects})")
+                    else:
+                        self.move(s, ServerDropped(f"{e} ({MAX_RECONNECT} reconnects failed)"))
+                except ServerDropped as e:
+                    self.move(s, e)
+                finally:
+                    if dev is not None:
+                        dev.close()
+            s.state = "done" if s.finished() else "stopped"
+        except Exception as e:
+            s.state, s.last_error = "failed", repr(e)
+            self.log(f"[FLEET] {s.name} failed: {e!r}")
+        finally:
+            if s.server is not None:
+                self.detach(s)
+                self.release(s)
+
+    def move(self, s, e):
+        """서버가 떨어진 세션: 사이클/스텝은 그대로 두고 다른 서버에서 이어서 실행."""
+        s.moves += 1
+        s.last_error = str(e)
+        s.state = "rebalancing"
+        self.log(f"[FLEET] {s.name}: {e}, moving (#{s.moves})")
+        self.detach(s)
+        self.release(s, dropped=True)
+
+    # ——— Status ———
+    def status(self):
+        now = time.monotonic()
+        elapsed = now - self.started
+        rows = [s.row() for s in self.sessions]
+        with self.lock:
+            leases = dict(self.leases)
+            dropped = {ip: t for ip, t in self.dropped.items() if t > now}
+            links = dict(self.links)
+        servers = {}
+        for ip in self.servers:
+            if ip in leases:
+                state = f"leased:{leases[ip]}"
+            elif ip in dropped:
+                state = f"dropped ({dropped[ip] - now:.0f}s)"
+            else:
+                state = "idle"
+            servers[ip] = {"state": state, "link": format_link(links.get(ip))}
+        busy = sum(r["busy_s"] for r in rows)
+        cycles = sum(s.done for s in self.sessions)
+        return {
+            "time":            time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "elapsed_s":       round(elapsed, 1),
+            "servers":         servers,
+            "sessions":        rows,
+            "cycles_done":     cycles,
+            "cycles_per_hour": cycles * 3600.0 / elapsed if elapsed > 0 else 0.0,
+            "utilization":     busy / (elapsed * len(self.servers)) if elapsed > 0 and self.servers else 0.0,
+        }
+
+    def write_status(self, path=STATUS_FILE):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp, path)
+
+    # ——— Run ———
+    def run(self, show=True, status_file=STATUS_FILE):
+        """모든 세션이 끝나거나 stop 이 설정될 때까지 실행하고 정리까지 마친다."""
+        subprocess.run(["modprobe","vhci-hcd"], stderr=subprocess.DEVNULL)
+        session_state.recover_stale(log=self.log)
+        self.log(f"[FLEET] {len(self.sessions)} sessions, {len(self.servers)} servers, "
+                 f"{self.workers} workers")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fleet") as pool:
+            futures = [pool.submit(self.run_session, s) for s in self.sessions]
+            while not all(f.done() for f in futures):
+                self._refresh(show, status_file)
+                self.stop.wait(SCREEN_PERIOD)
+        self._refresh(show, status_file)
+        if self.state:
+            # 남은 포트 정리 + 아직 남은 세션 API 할당 해제
+            session_state.teardown(self.state, log=self.log)
+
+    def _refresh(self, show, status_file):
+        try:
+            self.write_status(status_file)
+        except OSError:
+            pass
+        if show:
+            os.system('cls' if os.name=='nt' else 'clear')
+            print(format_status(self.status()))
+
+def format_status(st):
+    lines = [f"Fleet  {st['time']}  elapsed {st['elapsed_s']:.0f}s  "
+             f"cycles {st['cycles_done']} ({st['cycles_per_hour']:.1f}/h)  "
+             f"utilization {st['utilization']*100:.0f}%", ""]
+    lines.append("Servers:")
+    for ip, sv in st["servers"].items():
+        lines.append(f"  {ip:<26} {sv['state']:<22} [{sv['link']}]")
+    lines.append("")
+    lines.append(f"  {'session':<12} {'state':<12} {'server':<22} {'cycle':>9} {'mode':<10} "
+                 f"{'moves':>5} {'err':>4}")
+    for r in st["sessions"]:
+        cycle = f"{r['cycle']}/{r['cycles'] or '∞'}"
+        lines.append(f"  {r['name']:<12} {r['state']:<12} {r['server'] or '-':<22} {cycle:>9} "
+                     f"{r['mode'] or '-':<10} {r['moves']:>5} {r['errors']:>4}")
+        if r["last_error"] and r["state"] in ("rebalancing", "waiting", "failed"):
+            lines.append(f"  {'':<12} └ {r['last_error']}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many USB/IP board sessions from one controller")
+    parser.add_argument("config", nargs="?", help="fleet JSON config")
+    parser.add_argument("--workers", type=int, help="override the worker pool size")
+    parser.add_argument("--sequences", metavar="FILE",
+                        help="JSON file of timed GPIO sequences ({name: [[cmd, hold_s], ...]})")
+    parser.add_argument("--status-file", default=STATUS_FILE,
+                        help=f"where to write the aggregated status (default: {STATUS_FILE})")
+    parser.add_argument("--show", action="store_true",
+                        help="print the status of a running fleet from --status-file and exit")
+    parser.add_argument("--quiet", action="store_true", help="do not draw the status screen")
+    args = parser.parse_args()
+
+    if args.show:
+        try:
+            with open(args.status_file, encoding="utf-8") as f:
+                print(format_status(json.load(f)))
+        except (OSError, ValueError) as e:
+            parser.error(f"{args.status_file}: {e}")
+        raise SystemExit(0)
+    if not args.config:
+        parser.error("config is required")
+
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+    if args.workers:
+        config["workers"] = args.workers
+    if args.sequences:
+        gpio_sequencer.load_sequences(args.sequences)
+    try:
+        fleet = Fleet(config)
+    except (KeyError, ValueError) as e:
+        parser.error(f"{args.config}: {e}")
+
+    def handle_signal(signum, frame):
+        fleet_log(f"[INFO] Signal {signum} received, stopping fleet...")
+        fleet.stop.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    fleet.run(show=not args.quiet, status_file=args.status_file)
+    print(format_status(fleet.status()))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+USB/IP 서버(Numato 보드가 물리적으로 꽂힌 호스트)에서 실행하는 GPIO 에이전트.
+
+클라이언트는 USB/IP → vhci → cdc_acm 을 거쳐 명령을 한 줄씩 보내는 대신
+모드 이름만 TCP 로 보내고, 에이전트가 로컬 시리얼에서 시퀀스를 실행한다.
+
+프로토콜 (한 줄 = 요청 1개, UTF-8, '\\n' 종료):
+  요청 : "<seq> <MODE>[,<MODE>...]"     예) "7 POWEROFF,SNOR_EMMC"
+  응답 : "<seq> OK <elapsed_ms>"  또는  "<seq> ERR <message>"
+여러 모드를 한 요청에 묶을 수 있고(batch), 응답을 기다리지 않고 여러 요청을
+연달아 보내도 된다(pipelining). 응답은 요청 순서대로 온다.
+
+인증: 에이전트에 토큰(--token 또는 $GPIO_AGENT_TOKEN)이 설정되어 있으면
+연결의 첫 줄은 "AUTH <token>" 이어야 하고, 응답은 "AUTH OK" (틀리면 "AUTH ERR" 후 끊음).
+기본은 127.0.0.1 에서만 받으며, 다른 주소로 열려면 토큰이 필요하다.
+"""
+import argparse
+import hmac
+import ipaddress
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import serial
+
+import serial_io
+
+# ————— Configuration —————
+AGENT_PORT     = 3250     # usbipd(3240) 옆 포트
+DEFAULT_BAUD   = 115200
+PROMPT_TIMEOUT = 0.5      # 명령 1개당 프롬프트('>') 대기 최대 시간 (초)
+HOLD           = 0.1      # 명령 사이 유지 시간 (STR 펄스 폭 등, 클라이언트 스크립트의 DELAY 와 동일)
+TOKEN_ENV      = "GPIO_AGENT_TOKEN"   # 서버/클라이언트 공통 토큰 환경 변수
+
+# ————— Command Sequences —————
+MODES = {
+    "POWEROFF":  ['gpio iomask ff','gpio iodir 00','gpio writeall 00'],
+    "FWDN":      ['gpio iomask 8f','gpio writeall 80'],
+    "SNOR":      ['gpio iomask 8f','gpio writeall 81'],
+    "SNOR_EMMC": ['gpio iomask 8f','gpio writeall 82'],
+    "EMMC":      ['gpio iomask 8f','gpio writeall 85'],
+    "SNOR_UFS":  ['gpio iomask 8f','gpio writeall 8a'],
+    "UFS":       ['gpio iomask 8f','gpio writeall 8d'],
+    "USB3FWDN":  ['gpio iomask 8f','gpio writeall 88'],
+    "STR_MODE":  ['gpio iomask c0','gpio writeall c0',
+                  'gpio writeall 40','gpio writeall c0','gpio writeall 80'],
+    "PING":      [],   # 시리얼 접근 없이 RTT 확인용
+}
+MODE_PAYLOADS = serial_io.encode_modes(MODES)   # 요청마다 인코딩하지 않도록 미리
+
+class AgentError(Exception):
+    """에이전트가 ERR 로 응답했거나 연결이 끊긴 경우."""
+
+# ————— Server Side —————
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        token = self.server.token
+        if token:
+            first = self.rfile.readline().decode(errors="ignore").strip()
+            kind, _, given = first.partition(" ")
+            if kind != "AUTH" or not hmac.compare_digest(given.encode(), token.encode()):
+                self.server.log(f"[AGENT] {self.client_address[0]} rejected (bad token)")
+                self.wfile.write(b"AUTH ERR\n")
+                return
+            self.wfile.write(b"AUTH OK\n")
+        for raw in self.rfile:
+            line = raw.decode(errors="ignore").strip()
+            if not line:
+                continue
+            seq, _, body = line.partition(" ")
+            self.wfile.write(f"{seq} {self.server.run(body)}\n".encode())
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, addr, ser, hold=HOLD, log=print, token=None):
+        super().__init__(addr, _Handler)
+        self.ser = ser
+        self.hold = hold
+        self.log = log
+        self.token = token
+        self.lock = threading.Lock()   # 여러 클라이언트가 동시에 시리얼을 쓰지 않도록
+        self.io = serial_io.get(ser)
+
+    def run(self, body):
+        names = [n.strip() for n in body.split(",") if n.strip()]
+        unknown = [n for n in names if n not in MODES]
+        if not names or unknown:
+            return f"ERR unknown mode {','.join(unknown) or '<empty>'}"
+        t0 = time.monotonic()
+        try:
+            with self.lock:
+                self.io.reset()
+                for name in names:
+                    for cmd, data in zip(MODES[name], MODE_PAYLOADS[name]):
+                        if self.io.exchange(data, PROMPT_TIMEOUT) < 0:
+                            raise AgentError(f"no prompt after '{cmd}'")
+                        time.sleep(self.hold)
+        except (AgentError, serial.SerialException, OSError) as e:
+            self.log(f"[AGENT] {names} failed: {e}")
+            return f"ERR {e}"
+        ms = (time.monotonic() - t0) * 1000.0
+        self.log(f"[AGENT] {','.join(names)} done ({ms:.1f}ms)")
+        return f"OK {ms:.1f}"
+
+# ————— Client Side —————
+def parse_addr(addr, default_port=AGENT_PORT):
+    host, _, port = addr.rpartition(":")
+    if not host:
+        return addr, default_port
+    return host, int(port)
+
+class AgentClient:
+    """
+    gpio_agent 에 연결해 모드를 실행하는 클라이언트.
+    run_modes() 는 여러 모드를 한 요청으로 묶어 1 RTT 에 처리한다.
+    """
+    def __init__(self, host, port=AGENT_PORT, timeout=5.0, token=None):
+        self.addr = (host, port)
+        self.timeout = timeout
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+        self.sock = None
+        self.rfile = None
+        self.seq = 0
+
+    def connect(self):
+        self.sock = socket.create_connection(self.addr, timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile("rb")
+        if self.token:
+            self.sock.sendall(f"AUTH {self.token}\n".encode())
+            if self.rfile.readline().strip() != b"AUTH OK":
+                self.close()
+                raise AgentError(f"agent {self.addr[0]} rejected the token")
+        return self
+
+    def close(self):
+        if self.sock:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = None
+
+    def send(self, names):
+        """응답을 기다리지 않고 요청만 보낸다 (pipelining). 리턴: seq"""
+        if self.sock is None:
+            self.connect()
+        self.seq += 1
+        self.sock.sendall(f"{self.seq} {','.join(names)}\n".encode())
+        return self.seq
+
+    def recv(self):
+        """응답 하나를 읽는다. 리턴: (seq, 에이전트측 소요 ms)"""
+        line = self.rfile.readline().decode(errors="ignore").strip()
+        if not line:
+            self.close()
+            raise AgentError("agent closed connection")
+        seq, status, rest = (line.split(" ", 2) + ["", ""])[:3]
+        if status != "OK":
+            raise AgentError(rest or line)
+        return int(seq), float(rest)
+
+    def run_modes(self, names):
+        try:
+            self.send(names)
+            return self.recv()[1]
+        except OSError as e:
+            self.close()
+            raise AgentError(str(e))
+
+    def run_mode(self, name):
+        return self.run_modes([name])
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+# ————— Self Test —————
+def _fake_board(master, log):
+    """pty master 쪽에서 Numato 처럼 응답 (echo + "\\n\\r>"). 받은 명령을 log 에 추가."""
+    buf = b""
+    while True:
+        try:
+            data = os.read(master, 4096)
+        except OSError:
+            return
+        if not data:
+            return
+        buf += data
+        while b"\r" in buf:
+            cmd, buf = buf.split(b"\r", 1)
+            log.append(cmd.decode())
+            os.write(master, cmd + b"\n\r>")
+
+def self_test(clients=4, requests_per_client=25):
+    """
+    pty 가짜 보드에 에이전트를 띄워서 확인:
+    토큰 검사, 동시 클라이언트의 pipelining 응답 순서, 요청 단위 시퀀스가 섞이지 않는지.
+    리턴: 실패 메시지 리스트 (비어 있으면 통과)
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    board_log = []
+    threading.Thread(target=_fake_board, args=(master, board_log), daemon=True).start()
+    ser = serial.Serial(os.ttyname(slave), DEFAULT_BAUD, timeout=0.05)
+    server = AgentServer(("127.0.0.1", 0), ser, hold=0, log=lambda m: None, token="s3cret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    failures = []
+
+    try:
+        AgentClient(host, port, token="wrong").connect()
+        failures.append("bad token accepted")
+    except AgentError:
+        pass
+    try:
+        AgentClient(host, port, token="s3cret").connect().run_mode("NOPE")
+        failures.append("unknown mode accepted")
+    except AgentError:
+        pass
+
+    batches = [["POWEROFF"], ["SNOR_EMMC", "FWDN"], ["STR_MODE"], ["PING"]]
+    def worker(n):
+        try:
+            c = AgentClient(host, port, token="s3cret").connect()
+            sent = [c.send(batches[(n + i) % len(batches)]) for i in range(requests_per_client)]
+            got = [c.recv()[0] for _ in sent]
+            c.close()
+            if got != sent:
+                failures.append(f"client {n}: replies out of order")
+        except (AgentError, OSError) as e:
+            failures.append(f"client {n}: {e}")
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    # 요청 하나의 명령들이 다른 요청과 섞이지 않고 연속으로 실행됐는지
+    expected = sum(len(MODES[m]) for n in range(clients) for i in range(requests_per_client)
+                   for m in batches[(n + i) % len(batches)])
+    if len(board_log) != expected:
+        failures.append(f"board saw {len(board_log)} commands, expected {expected}")
+    i = 0
+    while i < len(board_log):
+        for seq in MODES.values():
+            if seq and board_log[i:i + len(seq)] == seq:
+                i += len(seq)
+                break
+        else:
+            failures.append(f"interleaved commands at {i}: {board_log[i:i + 3]}")
+            break
+
+    server.shutdown()
+    server.server_close()
+    ser.close()
+    os.close(master)
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Numato GPIO agent for the USB/IP server host")
+    parser.add_argument("--port", help="serial port of the Numato board (e.g. /dev/ttyACM0)")
+    parser.add_argument("--board", metavar="ID", help="find the serial port by Numato board ID")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--hold", type=float, default=HOLD,
+                        help=f"seconds to hold each GPIO command (default: {HOLD})")
+    parser.add_argument("--listen", default=f"127.0.0.1:{AGENT_PORT}",
+                        help=f"listen address (default: 127.0.0.1:{AGENT_PORT}; "
+                             "other addresses require a token)")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV),
+                        help=f"shared token clients must send (default: ${TOKEN_ENV})")
+    parser.add_argument("--self-test", action="store_true",
+                        help="run the agent against a pty fake board and exit")
+    args = parser.parse_args()
+
+    if args.self_test:
+        failures = self_test()
+        for f in failures:
+            print(f"[SELFTEST] FAIL: {f}")
+        print("[SELFTEST] " + ("FAILED" if failures else "OK"))
+        sys.exit(1 if failures else 0)
+
+    listen = parse_addr(args.listen)
+    if not args.token and not is_loopback(listen[0]):
+        parser.error(f"refusing to listen on {args.listen} without --token (or ${TOKEN_ENV})")
+
+    port, baud = args.port, args.baud
+    if args.board:
+        from gpio_discovery import find_board
+        found = find_board(args.board)
+        if not found:
+            parser.error(f"board {args.board} not found")
+        port, baud = found
+    if not port:
+        parser.error("--port or --board is required")
+
+    ser = serial.Serial(port, baudrate=baud, timeout=0.05, write_timeout=1, exclusive=True)
+    server = AgentServer(listen, ser, hold=args.hold, token=args.token)
+    print(f"[AGENT] {port}@{baud} serving on {args.listen}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ser.close()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import glob
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+import serial
+
+# ————— Configuration —————
+SUPPORTED_BAUDS = [115200, 9600]   # usbgpio_control 과 동일, 앞쪽부터 시도
+CANDIDATE_GLOBS = ["/dev/ttyACM*", "/dev/ttyUSB*"]
+NUMATO_VID      = "2a19"           # Numato Lab USB vendor ID
+PROBE_TIMEOUT   = 0.3              # 명령 1개당 응답 대기 (초)
+CACHE_FILE      = os.path.join(tempfile.gettempdir(), "numato_boards.json")
+
+# Numato 응답: "<cmd>\n\r<value>\n\r>" 형태 (echo + 값 + 프롬프트)
+_PROMPT = b">"
+
+def usb_vendor(port):
+    """tty 노드가 붙어 있는 USB 디바이스의 idVendor ("2a19" 등). USB 가 아니면 None."""
+    dev = os.path.realpath(f"/sys/class/tty/{os.path.basename(port)}/device")
+    # .../<usb device>/<interface>/ttyACM0 : interface 에서 위로 올라가며 찾는다
+    for _ in range(4):
+        try:
+            with open(os.path.join(dev, "idVendor")) as f:
+                return f.read().strip().lower()
+        except OSError:
+            dev = os.path.dirname(dev)
+    return None
+
+def candidate_ports():
+    """
+    Numato VID 를 가진 tty 만 리턴. 콘솔이나 다른 USB-시리얼 장치에는
+    probe 명령을 쓰지도, 보드레이트를 바꾸지도 않는다.
+    """
+    ports = []
+    for pattern in CANDIDATE_GLOBS:
+        ports += [p for p in glob.glob(pattern) if usb_vendor(p) == NUMATO_VID]
+    return sorted(ports)
+
+def port_signature(ports=None):
+    """
+    현재 tty 노드 목록의 지문. 핫플러그가 일어나면 노드가 새로 만들어지므로
+    (경로, 디바이스 번호, ctime) 가 바뀌고 캐시가 무효화된다.
+    """
+    sig = []
+    for p in ports if ports is not None else candidate_ports():
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        sig.append([p, st.st_rdev, st.st_ctime_ns])
+    return sig
+
+def _query(ser, cmd):
+    """명령 하나를 보내고 프롬프트('>')까지 읽어 값 부분만 리턴. 응답 없으면 None."""
+    ser.reset_input_buffer()
+    ser.write((cmd + "\r").encode())
+    buf = b""
+    deadline = time.monotonic() + PROBE_TIMEOUT
+    while time.monotonic() < deadline:
+        chunk = ser.read(ser.in_waiting or 1)
+        if chunk:
+            buf += chunk
+            if buf.rstrip().endswith(_PROMPT):
+                break
+    if not buf.rstrip().endswith(_PROMPT):
+        return None    # Numato 프롬프트가 아니면 (다른 장치의 콘솔 등) 무시
+    text = buf.decode(errors="ignore")
+    lines = [l.strip() for l in re.split(r"[\r\n]+", text)]
+    lines = [l for l in lines if l and l != ">" and l != cmd]
+    return lines[0].rstrip(">").strip() if lines else None
+
+def _probe(port, bauds):
+    """probe_port 본체. 포트를 열 수 없으면 (다른 프로세스가 사용 중 등) 예외."""
+    for baud in bauds:
+        # exclusive: 다른 프로세스가 잡고 있는 보드는 건드리지 않고 건너뛴다
+        with serial.Serial(port, baudrate=baud, timeout=0.05,
+                           write_timeout=PROBE_TIMEOUT, exclusive=True) as ser:
+            ser.write(b"\r")          # 입력 중이던 명령 정리
+            time.sleep(0.02)
+            version = _query(ser, "ver")
+            if not version:
+                continue
+            board_id = _query(ser, "id get")
+            if board_id:
+                return {"port": port, "baud": baud,
+                        "id": board_id, "version": version}
+    return None
+
+def probe_port(port, bauds=SUPPORTED_BAUDS):
+    """
+    포트 하나에 대해 보드레이트를 차례로 바꿔가며 `ver` / `id get` 을 보내본다.
+    Numato 보드로 응답하면 {"port", "baud", "id", "version"} 리턴, 아니면 None.
+    Numato VID 가 아니거나 사용 중인 포트는 열지 않고 None.
+    """
+    if usb_vendor(port) != NUMATO_VID:
+        return None
+    try:
+        return _probe(port, bauds)
+    except (serial.SerialException, OSError):
+        return None
+
+def probe_all(ports=None, busy=None):
+    """
+    모든 후보 포트를 동시에 probe (포트마다 스레드 1개). 리턴: {id: info}
+    busy 리스트를 주면 열 수 없었던 포트를 거기에 추가한다.
+    """
+    ports = candidate_ports() if ports is None else ports
+    found = []
+    lock = threading.Lock()
+
+    def worker(p):
+        try:
+            info = _probe(p, SUPPORTED_BAUDS)
+        except (serial.SerialException, OSError):
+            if busy is not None:
+                with lock:
+                    busy.append(p)
+            return
+        if info:
+            with lock:
+                found.append(info)
+
+    # 스레드 이름은 trace 기록/재실행에서 호출을 나누는 키
+    threads = [threading.Thread(target=worker, args=(p,), name=f"probe:{p}", daemon=True)
+               for p in ports]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    boards = {}
+    for info in sorted(found, key=lambda i: i["port"]):
+        if info["id"] in boards:
+            print(f"[DISCOVERY] duplicate board id {info['id']} on "
+                  f"{boards[info['id']]['port']} and {info['port']}", file=sys.stderr)
+            continue
+        boards[info["id"]] = info
+    return boards
+
+def _load_cache():
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_cache(signature, boards):
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"signature": signature, "boards": boards}, f)
+    os.replace(tmp, CACHE_FILE)
+
+def discover(force=False):
+    """
+    ID → 보드 정보 맵을 리턴. tty 구성이 마지막 probe 이후 그대로면 캐시를 쓰고
+    (시리얼 통신 없음), 핫플러그로 바뀌었거나 force=True 면 다시 probe 한다.
+    """
+    ports = candidate_ports()
+    signature = port_signature(ports)
+    cache = _load_cache() or {}
+    if not force and cache.get("signature") == signature:
+        return cache.get("boards", {})
+    busy = []
+    boards = probe_all(ports, busy)
+    # 사용 중이라 열지 못한 포트는, 노드가 그대로라면 이전 probe 결과를 유지
+    unchanged = {p for p, *rest in signature
+                 if [p, *rest] in (cache.get("signature") or [])}
+    for board_id, info in cache.get("boards", {}).items():
+        if info["port"] in busy and info["port"] in unchanged:
+            boards.setdefault(board_id, info)
+    try:
+        _save_cache(signature, boards)
+    except OSError:
+        pass
+    return boards
+
+def find_board(board_id):
+    """보드 ID 로 (port, baud) 를 찾는다. 없으면 None."""
+    info = discover().get(board_id)
+    if info is None:
+        # 캐시에 없는 ID 라면 한 번은 새로 probe
+        info = discover(force=True).get(board_id)
+    return (info["port"], info["baud"]) if info else None
+
+if __name__ == "__main__":
+    force = "--force" in sys.argv
+    boards = discover(force=force)
+    if not boards:
+        print("No Numato GPIO boards found.")
+        sys.exit(1)
+    for board_id, info in sorted(boards.items()):
+        print(f"{board_id}: {info['port']}@{info['baud']} (ver {info['version']})")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import time
+
+import serial_io
+
+# ————— Configuration —————
+SPIN_WINDOW = 0.002   # deadline 직전 이 시간 동안은 sleep 대신 busy-wait (초)
+LEAD_TIME   = 0.005   # 첫 edge 전 여유 (초). 시작 지연이 jitter 로 잡히지 않도록
+
+# ————— Sequences (data) —————
+# 시퀀스 = [(명령, hold 초), ...]. 각 명령은 이전 명령의 deadline + hold 시각에 나간다.
+# --sequences FILE 로 같은 형식의 JSON ({"이름": [[명령, hold], ...]}) 을 불러와 덮어쓸 수 있다.
+SEQUENCES = {
+    "STR_MODE": [
+        ("gpio iomask c0",   0.1),
+        ("gpio writeall c0", 0.1),
+        ("gpio writeall 40", 0.1),   # STR 키 펄스 폭
+        ("gpio writeall c0", 0.1),
+        ("gpio writeall 80", 0.1),
+    ],
+}
+
+def with_hold(cmds, hold):
+    """기존 명령 리스트(POWEROFF 등)를 일정한 hold 의 시퀀스로 변환."""
+    return [(cmd, hold) for cmd in cmds]
+
+def load_sequences(path):
+    """JSON 파일의 시퀀스들을 SEQUENCES 에 병합하고 불러온 이름 리스트를 리턴."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for name, steps in data.items():
+        parsed = []
+        for step in steps:
+            cmd, hold = step
+            if not isinstance(cmd, str) or float(hold) < 0:
+                raise ValueError(f"{path}: bad step {step!r} in {name}")
+            parsed.append((cmd, float(hold)))
+        SEQUENCES[name] = parsed
+    return list(data)
+
+# ————— Runner —————
+def wait_until(deadline):
+    """monotonic deadline 까지 대기. 대부분은 sleep, 마지막 SPIN_WINDOW 는 busy-wait."""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if remaining > SPIN_WINDOW:
+            time.sleep(remaining - SPIN_WINDOW)
+
+def _drain(ser):
+    """응답(echo/프롬프트)을 블로킹 없이 버린다. 입력 버퍼가 차서 보드가 멈추지 않도록."""
+    serial_io.get(ser).discard()
+
+def run_timed(ser, steps):
+    """
+    steps 의 각 명령을 절대 deadline (시작 시각 + 앞선 hold 의 합) 에 보낸다.
+    sleep 오차가 다음 step 으로 누적되지 않으므로 전체 길이가 drift 하지 않는다.
+    리턴: step 별 {"cmd", "scheduled_s", "actual_s", "jitter_ms", "write_ms"} 리스트
+    """
+    payloads = [serial_io.payload(cmd) for cmd, _ in steps]
+    report = []
+    t0 = time.monotonic() + LEAD_TIME
+    deadline = t0
+    for (cmd, hold), payload in zip(steps, payloads):
+        wait_until(deadline)
+        edge = time.monotonic()
+        ser.write(payload)
+        done = time.monotonic()
+        report.append({
+            "cmd":         cmd,
+            "scheduled_s": deadline - t0,
+            "actual_s":    edge - t0,
+            "jitter_ms":   (edge - deadline) * 1000.0,
+            "write_ms":    (done - edge) * 1000.0,
+        })
+        _drain(ser)
+        deadline += hold
+    # 마지막 step 의 hold 까지 채운 뒤 리턴 (다음 시퀀스와 간격 보장)
+    wait_until(deadline)
+    _drain(ser)
+    return report
+
+def jitter_summary(report):
+    jit = [abs(r["jitter_ms"]) for r in report]
+    return {
+        "steps":          len(report),
+        "max_jitter_ms":  max(jit) if jit else 0.0,
+        "mean_jitter_ms": sum(jit) / len(jit) if jit else 0.0,
+        "max_write_ms":   max((r["write_ms"] for r in report), default=0.0),
+    }
+
+def format_report(name, report):
+    s = jitter_summary(report)
+    lines = [f"[SEQ] {name}: {s['steps']} edges, jitter max {s['max_jitter_ms']:.3f}ms "
+             f"mean {s['mean_jitter_ms']:.3f}ms, write max {s['max_write_ms']:.3f}ms"]
+    for r in report:
+        lines.append(f"[SEQ]   {r['scheduled_s']*1000:8.1f}ms {r['cmd']:<18} "
+                     f"jitter {r['jitter_ms']:+.3f}ms write {r['write_ms']:.3f}ms")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    import serial
+    parser = argparse.ArgumentParser(description="Run a timed GPIO sequence and report edge jitter")
+    parser.add_argument("port")
+    parser.add_argument("name", nargs="?", default="STR_MODE")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--sequences", metavar="FILE", help="JSON sequence definitions")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.sequences:
+        load_sequences(args.sequences)
+    if args.name not in SEQUENCES:
+        parser.error(f"unknown sequence {args.name} (known: {', '.join(SEQUENCES)})")
+    with serial.Serial(args.port, baudrate=args.baud, timeout=0, write_timeout=1,
+                       exclusive=True) as ser:
+        for _ in range(args.repeat):
+            print(format_report(args.name, run_timed(ser, SEQUENCES[args.name])))
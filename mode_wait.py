@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import fnmatch
+import glob
+import os
+import re
+import subprocess
+import time
+
+import session_state
+import usbip_ports
+
+try:
+    import pyudev     # 있으면 udev 이벤트로 깨어나고, 없으면 짧은 주기 polling
+except ImportError:
+    pyudev = None
+
+# ————— Configuration —————
+SYSFS_USB       = "/sys/bus/usb/devices"
+TTY_GLOBS       = ["/dev/ttyACM*", "/dev/ttyUSB*"]
+WAIT_TIMEOUT    = 30.0   # 디바이스 등장 대기 최대 시간 (초)
+POLL_INTERVAL   = 0.05   # pyudev 가 없을 때 로컬 스캔 주기 (초)
+IMPORT_INTERVAL = 0.5    # 서버의 새 exportable bus ID 확인 주기 (초)
+
+# ————— Local Device Snapshot —————
+def usb_devices():
+    """sysfs 의 USB 디바이스 → "vid:pid" 맵 (인터페이스 노드는 제외)."""
+    devs = {}
+    for path in glob.glob(os.path.join(SYSFS_USB, "*")):
+        try:
+            with open(os.path.join(path, "idVendor")) as f:
+                vid = f.read().strip()
+            with open(os.path.join(path, "idProduct")) as f:
+                pid = f.read().strip()
+        except OSError:
+            continue
+        devs[os.path.basename(path)] = f"{vid}:{pid}"
+    return devs
+
+def tty_devices():
+    ports = []
+    for pattern in TTY_GLOBS:
+        ports += glob.glob(pattern)
+    return set(ports)
+
+def snapshot():
+    return usb_devices(), tty_devices()
+
+def new_devices(before, after):
+    """before 이후 새로 생긴 (kind, 이름, id) 목록. kind 는 "usb" 또는 "tty"."""
+    usb0, tty0 = before
+    usb1, tty1 = after
+    found = [("usb", name, vp) for name, vp in sorted(usb1.items()) if usb0.get(name) != vp]
+    found += [("tty", p, None) for p in sorted(tty1 - tty0)]
+    return found
+
+def matches(dev, expect):
+    """
+    expect 형식:
+      None         → 새 USB 디바이스/tty 아무거나
+      "vid:pid"    → USB vendor/product (pid 생략 "vid:" 가능)
+      "/dev/..."   → tty 경로 glob (예: "/dev/ttyUSB*")
+    """
+    kind, name, vp = dev
+    if expect is None:
+        return True
+    if "/" in expect:
+        return kind == "tty" and fnmatch.fnmatch(name, expect)
+    return kind == "usb" and vp is not None and vp.startswith(expect.lower())
+
+# ————— USB/IP Import —————
+def exportable_busids(server_ip):
+    try:
+        out = subprocess.run(
+            ["usbip","list","-r",server_ip],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, timeout=2, check=True
+        ).stdout
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+        return []
+    return re.findall(r"^\s*(\d+-[\d\.]+):", out, re.MULTILINE)
+
+def import_new(server_ip, known, log=print, session=None):
+    """
+    서버에 새로 나타난 exportable bus ID 를 바로 attach 한다.
+    watchdog 의 다음 polling 을 기다리지 않기 위함 (이미 attach 된 경우 실패는 무시).
+    attach 한 bus ID 는 watchdog 과 같이 session 상태 파일에 기록하고 포트 스냅샷을 무효화한다.
+    """
+    for b in exportable_busids(server_ip):
+        if b in known:
+            continue
+        known.add(b)
+        try:
+            subprocess.run(
+                ["usbip","attach","-r",server_ip,"-b",b],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=5, check=True
+            )
+            log(f"[WAIT] Imported {b} from {server_ip}")
+            usbip_ports.invalidate()
+            session_state.add_busid(session, b)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError):
+            pass
+
+# ————— Switch & Wait —————
+_MONITOR = None   # 프로세스당 netlink 소켓 하나를 만들어 switch 마다 재사용
+
+def _monitor():
+    global _MONITOR
+    if pyudev is None:
+        return None
+    if _MONITOR is None:
+        try:
+            mon = pyudev.Monitor.from_netlink(pyudev.Context())
+            mon.filter_by("usb")
+            mon.filter_by("tty")
+            mon.start()
+            _MONITOR = mon
+        except Exception:
+            return None
+    # 이전 switch 이후 쌓인 이벤트는 버린다 (대기 루프가 바로 깨어나지 않도록)
+    while _MONITOR.poll(timeout=0) is not None:
+        pass
+    return _MONITOR
+
+def run_hook(hook, dev, log=print):
+    """준비된 디바이스 정보를 환경변수로 넘겨 hook 명령(예: 플래싱)을 실행. 리턴: exit code"""
+    kind, name, vp = dev
+    env = dict(os.environ,
+               MODE_WAIT_KIND=kind,
+               MODE_WAIT_DEVICE=name if kind == "tty" else os.path.join(SYSFS_USB, name),
+               MODE_WAIT_ID=vp or "")
+    log(f"[WAIT] Hook: {hook}")
+    rc = subprocess.run(hook, shell=True, env=env).returncode
+    log(f"[WAIT] Hook exited {rc}")
+    return rc
+
+def switch_and_wait(switch, expect=None, server_ip=None, timeout=WAIT_TIMEOUT,
+                    hook=None, log=print, session=None):
+    """
+    switch() 로 모드를 바꾼 뒤 expect 에 맞는 USB 디바이스/tty 가 로컬에 나타날 때까지
+    (udev 이벤트 또는 짧은 polling 으로) 기다린다. server_ip 가 있으면 서버에 새로 뜬
+    bus ID 를 직접 import 해서 watchdog 주기만큼의 지연을 없앤다
+    (import 한 bus ID 는 session 상태에 기록되어 teardown 대상이 된다).
+    준비되면 hook 을 실행하고 결과를 리턴:
+      {"ready", "device", "switch_s", "ready_s", "hook_rc"}
+      (ready_s = switch 시작부터 디바이스 등장까지의 시간)
+    """
+    mon = _monitor()
+    before = snapshot()
+    # 스위치 전부터 보이던 bus ID 는 새 디바이스가 아니다 (watchdog 담당)
+    known = set(exportable_busids(server_ip)) if server_ip else set()
+
+    t0 = time.monotonic()
+    switch()
+    switch_s = time.monotonic() - t0
+    deadline = t0 + timeout
+    next_import = 0.0
+    result = {"ready": False, "device": None, "switch_s": switch_s,
+              "ready_s": None, "hook_rc": None}
+
+    while True:
+        now = time.monotonic()
+        if server_ip and now >= next_import:
+            import_new(server_ip, known, log=log, session=session)
+            next_import = now + IMPORT_INTERVAL
+        for dev in new_devices(before, snapshot()):
+            if matches(dev, expect):
+                result.update(ready=True, device=dev,
+                              ready_s=time.monotonic() - t0)
+                break
+        if result["ready"] or now >= deadline:
+            break
+        wait = min(deadline, next_import if server_ip else deadline) - now
+        if mon is not None:
+            # udev add 이벤트가 오면 바로 깨어나 다시 스캔
+            mon.poll(timeout=max(min(wait, IMPORT_INTERVAL), 0.01))
+        else:
+            time.sleep(max(min(wait, POLL_INTERVAL), 0.001))
+
+    if not result["ready"]:
+        log(f"[WAIT] Timeout after {timeout:.1f}s waiting for {expect or 'new device'}")
+        return result
+
+    kind, name, vp = result["device"]
+    log(f"[WAIT] Ready: {name}{' ('+vp+')' if vp else ''} "
+        f"switch {switch_s*1000:.0f}ms, switch→ready {result['ready_s']:.2f}s")
+    if hook:
+        result["hook_rc"] = run_hook(hook, result["device"], log=log)
+    return result
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Remote_control 의 asyncio 런타임 (Remote_control.py --async).
+
+watchdog, 콘솔 입력, GPIO 시리얼 I/O, API 할당 확인, 화면 갱신을 각각 취소 가능한
+task 로 돌린다. 모든 외부 호출에 제한 시간이 있어서 usbip 명령 하나가 멈춰도
+다른 task 는 계속 응답하고, 종료(0 입력, SIGINT, SIGTERM)는 task 취소 → 병렬 teardown
+순서로 진행된다. 시그널 핸들러 안에서는 stop 이벤트만 세운다.
+usbip 명령(create_subprocess_exec)과 stdin reader 는 trace_replay 가 가로채지 않으므로
+--record / --replay 와 함께 쓸 수 없다.
+"""
+import asyncio
+import os
+import re
+import signal
+import socket
+import sys
+import threading
+
+import requests
+
+import session_state
+import usbip_ports
+
+# ————— Configuration —————
+CMD_TIMEOUT      = 3.0    # usbip port / list 1회 제한 (초)
+ATTACH_TIMEOUT   = 10.0   # usbip attach 1회 제한 (초)
+WATCHDOG_PERIOD  = 1.0    # watchdog 주기 (초)
+MAX_RETRY        = 3      # 떨어진 디바이스 재attach 시도 횟수
+GPIO_TIMEOUT     = 10.0   # 일반 모드 1회 실행 제한 (초)
+DOWNLOAD_TIMEOUT = 600.0  # 다운로드 모드 (디바이스 대기 + 플래싱 hook 포함) 제한 (초)
+API_PERIOD       = 30.0   # API 할당 확인 주기 (초)
+API_TIMEOUT      = 2.0
+REFRESH_PERIOD   = 2.0    # 시리얼 포트 변화 확인 주기 (초)
+
+# ————— Helpers —————
+def in_thread(fn, *args):
+    """
+    블로킹 함수를 daemon 스레드에서 실행하고 awaitable 을 리턴.
+    asyncio.to_thread 와 달리 멈춘 호출이 있어도 프로세스 종료를 막지 않는다.
+    """
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def settle(ok, value):
+        if not fut.done():
+            if ok:
+                fut.set_result(value)
+            else:
+                fut.set_exception(value)
+
+    def worker():
+        try:
+            value, ok = fn(*args), True
+        except BaseException as e:
+            value, ok = e, False
+        try:
+            loop.call_soon_threadsafe(settle, ok, value)
+        except RuntimeError:
+            pass    # 이벤트 루프가 이미 종료됨 (늦게 끝난 호출)
+
+    threading.Thread(target=worker, daemon=True).start()
+    return fut
+
+def _kill(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)   # 자식이 띄운 프로세스까지 함께 정리
+    except ProcessLookupError:
+        pass
+
+async def run_cmd(argv, timeout=CMD_TIMEOUT):
+    """
+    명령을 비동기로 실행. 리턴: (returncode, stdout, stderr).
+    제한 시간을 넘기거나 실행 자체가 실패하면 프로세스를 정리하고 None.
+    """
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            start_new_session=True)
+    except OSError:
+        return None
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        _kill(proc)
+        await proc.wait()
+        return None
+    except asyncio.CancelledError:
+        _kill(proc)
+        await proc.wait()
+        raise
+    return proc.returncode, out.decode(errors="ignore"), err.decode(errors="ignore")
+
+# ————— Tasks —————
+async def watchdog_task(rc, server_ip, initial_busids):
+    """Remote_control.watchdog_loop 과 같은 동작, 단 모든 usbip 호출에 제한 시간."""
+    log = rc.usbip_log
+    log(f"[WATCHDOG] Monitoring: {initial_busids}")
+    known = set(initial_busids)
+    retries = {b: 0 for b in known}
+    while True:
+        await asyncio.sleep(WATCHDOG_PERIOD)
+        # 같은 호스트의 다른 세션과 `usbip port` 스냅샷을 공유 (usbip_ports)
+        try:
+            attached_now = await asyncio.wait_for(in_thread(usbip_ports.attached_busids),
+                                                  CMD_TIMEOUT)
+        except asyncio.TimeoutError:
+            log("[WATCHDOG] usbip port timed out")
+            continue
+        if attached_now is None:
+            log("[WATCHDOG] usbip port failed, skipping check")
+            continue
+
+        for b in list(known):
+            if b in attached_now:
+                continue
+            if retries[b] >= MAX_RETRY:
+                log(f"[WATCHDOG] Give up on {b}")
+                known.remove(b)
+                continue
+            log(f"[WATCHDOG] Re-attach {b} (#{retries[b]+1})")
+            r = await run_cmd(["usbip","attach","-r",server_ip,"-b",b], ATTACH_TIMEOUT)
+            if r is not None and r[0] == 0:
+                log(f"[WATCHDOG] Re-attached {b}")
+                retries[b] = 0
+                usbip_ports.invalidate()
+            else:
+                retries[b] += 1
+                log(f"[WATCHDOG] Re-attach failed for {b} (err #{retries[b]})")
+
+        res = await run_cmd(["usbip","list","-r",server_ip])
+        if res is None:
+            log(f"[WATCHDOG] usbip list -r {server_ip} timed out")
+            continue
+        for b in re.findall(r"^\s*(\d+-[\d\.]+):", res[1], re.MULTILINE):
+            if b in known:
+                continue
+            if rc.SESSION and b in rc.SESSION["busids"]:
+                # mode_wait.import_new 이 이미 attach 해서 세션에 기록한 bus ID
+                known.add(b)
+                retries[b] = 0
+                continue
+            log(f"[WATCHDOG] New exportable detected: {b}")
+            r = await run_cmd(["usbip","attach","-r",server_ip,"-b",b], ATTACH_TIMEOUT)
+            if r is not None and r[0] == 0:
+                log(f"[WATCHDOG] Attached new {b}")
+                usbip_ports.invalidate()
+                known.add(b)
+                retries[b] = 0
+                session_state.add_busid(rc.SESSION, b)
+            else:
+                log(f"[WATCHDOG] Failed attach new {b}:\n{r[2] if r else 'timeout'}")
+
+async def console_task(rc, gpio_queue, stop):
+    """stdin 한 줄 = 메뉴 선택. 입력 대기는 이벤트 루프의 reader 로 처리 (블로킹 없음)."""
+    loop = asyncio.get_running_loop()
+    lines = asyncio.Queue()
+
+    def on_stdin():
+        line = sys.stdin.readline()
+        lines.put_nowait(line if line else None)
+
+    loop.add_reader(sys.stdin.fileno(), on_stdin)
+    try:
+        while True:
+            print("Select> ", end="", flush=True)
+            line = await lines.get()
+            if line is None:          # EOF
+                stop.set()
+                return
+            c = line.strip()
+            if c == "0":
+                stop.set()
+                return
+            if c in rc.MODE_MENU:
+                gpio_queue.put_nowait(c)
+            else:
+                rc.usbip_log("[GPIO] Enter 0-9")
+    finally:
+        loop.remove_reader(sys.stdin.fileno())
+
+async def gpio_task(rc, ser, gpio_queue):
+    """
+    선택된 모드를 워커 스레드에서 순서대로 실행. 시리얼이 멈춰도 제한 시간 후
+    다음 선택을 받을 수 있고, 늦게 끝나는 실행과 겹치지 않도록 스레드 락으로 직렬화한다.
+    """
+    lock = threading.Lock()
+
+    def apply(c):
+        with lock:
+            rc.apply_mode(ser, c)
+
+    while True:
+        c = await gpio_queue.get()
+        key = rc.MODE_MENU[c][2]
+        timeout = DOWNLOAD_TIMEOUT if key in rc.DOWNLOAD_MODES else GPIO_TIMEOUT
+        try:
+            await asyncio.wait_for(in_thread(apply, c), timeout)
+        except asyncio.TimeoutError:
+            rc.usbip_log(f"[GPIO ERROR] {rc.MODE_MENU[c][1]} timed out after {timeout:.0f}s")
+        except Exception as e:
+            rc.usbip_log(f"[GPIO ERROR] {e}")
+
+async def api_task(rc, server_ip):
+    """주기적으로 API 에 내 할당이 남아 있는지 확인하고, 없어졌으면 다시 보고."""
+    client_ip = socket.gethostbyname(socket.gethostname())
+
+    def check():
+        r = requests.get(rc.API_URL, timeout=API_TIMEOUT)
+        r.raise_for_status()
+        return any(a.get("source_ip") == client_ip and a.get("value") == server_ip
+                   for a in r.json().get("data", []))
+
+    while True:
+        await asyncio.sleep(API_PERIOD)
+        try:
+            present = await asyncio.wait_for(in_thread(check), API_TIMEOUT + 1)
+        except Exception as e:
+            rc.usbip_log(f"[REPORT] check FAIL → {e}")
+            continue
+        if not present:
+            rc.usbip_log("[REPORT] allocation missing, re-reporting")
+            try:
+                await asyncio.wait_for(in_thread(rc.report_to_api, server_ip),
+                                       API_TIMEOUT + 1)
+            except asyncio.TimeoutError:
+                rc.usbip_log("[REPORT] re-report timed out")
+
+async def refresh_task(rc):
+    """시리얼 포트 구성이 바뀌면 메뉴를 다시 그린다 (입력 중 화면을 불필요하게 지우지 않음)."""
+    last = rc.get_serial_ports()
+    while True:
+        await asyncio.sleep(REFRESH_PERIOD)
+        now = rc.get_serial_ports()
+        if now != last:
+            last = now
+            rc.render_menu()
+            print("Select> ", end="", flush=True)
+
+# ————— Runtime —————
+async def _main(rc, server_ip, attached, ser):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    gpio_queue = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(watchdog_task(rc, server_ip, attached), name="watchdog"),
+        asyncio.create_task(console_task(rc, gpio_queue, stop), name="console"),
+        asyncio.create_task(gpio_task(rc, ser, gpio_queue), name="gpio"),
+        asyncio.create_task(api_task(rc, server_ip), name="api"),
+        asyncio.create_task(refresh_task(rc), name="refresh"),
+    ]
+    rc.render_menu()
+    stopper = asyncio.create_task(stop.wait())
+    done, _ = await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+    for t in done:
+        if t is not stopper and not t.cancelled() and t.exception():
+            rc.usbip_log(f"[ASYNC] task {t.get_name()} failed: {t.exception()!r}")
+
+    # 구조화된 종료: task 취소 → 정리 대기 → 병렬 teardown (제한 시간)
+    rc.usbip_log("[ASYNC] Shutting down")
+    for t in tasks + [stopper]:
+        t.cancel()
+    await asyncio.gather(*tasks, stopper, return_exceptions=True)
+    try:
+        await asyncio.wait_for(
+            in_thread(lambda: session_state.teardown(rc.SESSION, log=rc.usbip_log)),
+            session_state.TEARDOWN_DEADLINE + 1)
+    except asyncio.TimeoutError:
+        rc.usbip_log("[ASYNC] Teardown exceeded deadline")
+    ser.close()
+    rc.usbip_log("[GPIO] Port closed")
+
+def run(rc, server_ip, attached, ser):
+    """
+    rc: Remote_control 모듈 (usbip_log, MODE_MENU, apply_mode, render_menu, SESSION 등).
+    attach 와 API 보고가 끝난 뒤 호출하며, 종료 시 teardown 까지 마치고 리턴한다.
+    """
+    asyncio.run(_main(rc, server_ip, attached, ser))
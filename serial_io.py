@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+GPIO 명령/콘솔 트래픽용 시리얼 I/O 계층.
+
+- 명령 payload (cmd + "\\r") 는 한 번만 인코딩해서 재사용한다 (모드 테이블은 import 시 미리).
+- 수신 데이터는 미리 잡아 둔 bytearray 원형 버퍼의 빈 공간으로 바로 읽는다
+  (POSIX 실제 포트는 select + os.readv, 그 외는 readinto).
+- 프롬프트/줄 끝 탐색은 버퍼 안에서 bytearray.find 로, 이미 본 구간은 다시 보지 않는다.
+응답 내용이 필요 없는 모드 전환 경로에서는 명령당 bytes 객체를 새로 만들지 않는다.
+
+python serial_io.py 로 pty 가짜 보드를 상대로 기존 방식과 할당량/처리량을 비교한다.
+"""
+import argparse
+import os
+import select
+import time
+import weakref
+
+import serial
+
+# ————— Configuration —————
+RING_SIZE      = 4096     # 원형 버퍼 크기 (Numato 응답은 수십 바이트, 콘솔 캡처는 더 크게)
+PROMPT         = ord(">") # Numato 프롬프트
+NEWLINE        = ord("\n")
+PROMPT_TIMEOUT = 0.5      # 명령 1개당 프롬프트 대기 최대 시간 (초)
+
+# ————— Payloads —————
+_PAYLOADS = {}
+
+def payload(cmd):
+    """명령 문자열 → 전송할 bytes (캐시)."""
+    p = _PAYLOADS.get(cmd)
+    if p is None:
+        p = _PAYLOADS[cmd] = (cmd + "\r").encode()
+    return p
+
+def encode_modes(modes):
+    """{모드 이름: [명령, ...]} → {모드 이름: (payload, ...)} (미리 인코딩)."""
+    return {name: tuple(payload(cmd) for cmd in cmds) for name, cmds in modes.items()}
+
+# ————— Ring Buffer —————
+class RingBuffer:
+    """
+    고정 크기 원형 버퍼. 위치는 계속 증가하는 오프셋(head, tail)으로 관리하고
+    실제 인덱스는 % size. 빈 공간/데이터 구간을 memoryview 로 내주어 복사 없이 읽고 쓴다.
+    """
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.whole = (self.view,)   # 비어 있을 때 readv 에 그대로 넘기는 전체 공간
+        self.head = 0       # 아직 소비하지 않은 첫 바이트
+        self.tail = 0       # 다음에 쓸 위치
+        self.scan = 0       # 구분자(프롬프트/줄 끝)를 이미 찾아본 위치
+        self.overflow = 0   # 공간이 없어 버린 바이트 수
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def clear(self):
+        self.head = self.scan = self.tail
+
+    def consume(self, n):
+        self.head += min(n, self.tail - self.head)
+        self.scan = max(self.scan, self.head)
+
+    def commit(self, n):
+        self.tail += n
+
+    def free_views(self):
+        """빈 공간 (1~2 개 memoryview). 가득 차면 오래된 절반을 버리고 공간을 만든다."""
+        if self.head == self.tail:
+            # 비었으면 처음부터 다시 채운다 (명령/응답 패턴에서는 slice 를 만들 일이 없음)
+            self.head = self.tail = self.scan = 0
+            return self.whole
+        if self.tail - self.head == self.size:
+            drop = self.size // 2
+            self.head += drop
+            self.scan = max(self.scan, self.head)
+            self.overflow += drop
+        h, t = self.head % self.size, self.tail % self.size
+        if t < h:
+            return (self.view[t:h],)
+        if h == 0:
+            return (self.view[t:],)
+        return (self.view[t:], self.view[:h])
+
+    def views(self, start, end):
+        """오프셋 [start, end) 구간 (1~2 개 memoryview, 복사 없음)."""
+        s, n = start % self.size, end - start
+        if s + n <= self.size:
+            return (self.view[s:s + n],)
+        return (self.view[s:], self.view[:s + n - self.size])
+
+    def rfind(self, byte, start):
+        """오프셋 start 부터 tail 전까지 마지막 byte 의 오프셋. 없으면 -1."""
+        start = max(start, self.head)
+        end = self.tail
+        while end > start:
+            i = (end - 1) % self.size + 1
+            lo = max(0, i - (end - start))
+            j = self.buf.rfind(byte, lo, i)
+            if j >= 0:
+                return end - (i - j)
+            end -= i - lo
+        return -1
+
+    def count(self, byte, start, end):
+        """오프셋 [start, end) 안의 byte 개수."""
+        s, n = start % self.size, end - start
+        if s + n <= self.size:
+            return self.buf.count(byte, s, s + n)
+        return self.buf.count(byte, s) + self.buf.count(byte, 0, s + n - self.size)
+
+    def find(self, byte, start):
+        """오프셋 start 부터 tail 전까지 byte 의 오프셋. 없으면 -1."""
+        start = max(start, self.head)
+        while start < self.tail:
+            i = start % self.size
+            end = min(self.size, i + self.tail - start)
+            j = self.buf.find(byte, i, end)
+            if j >= 0:
+                return start + j - i
+            start += end - i
+        return -1
+
+# ————— Serial I/O —————
+def _fd(ser):
+    """직접 readv 할 수 있는 실제 POSIX 포트면 fd, 아니면 None (trace 기록/재실행 래퍼 등)."""
+    if not hasattr(os, "readv") or not isinstance(ser, serial.SerialBase):
+        return None
+    try:
+        return ser.fileno()
+    except (AttributeError, OSError, serial.SerialException):
+        return None
+
+class SerialIO:
+    """시리얼 포트 하나에 원형 버퍼를 붙여 쓰는 핸들. 포트마다 get(ser) 로 하나씩 재사용."""
+    def __init__(self, ser, size=RING_SIZE):
+        self.ser = ser
+        self.ring = RingBuffer(size)
+        self._fd = _fd(ser)
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def fill(self, timeout):
+        """수신 데이터를 버퍼 빈 공간으로 읽는다. 리턴: 읽은 바이트 수 (timeout 동안 없으면 0)."""
+        views = self.ring.free_views()
+        if self._fd is not None:
+            if not select.select([self._fd], [], [], max(timeout, 0))[0]:
+                return 0
+            try:
+                n = os.readv(self._fd, views)
+            except BlockingIOError:
+                return 0
+            if n == 0:
+                raise serial.SerialException("device reports readiness to read but returned no data")
+        else:
+            waiting = self.ser.in_waiting
+            if not waiting and timeout <= 0:
+                return 0
+            view = views[0]
+            n = self.ser.readinto(view[:waiting] if waiting else view[:1]) or 0
+        self.ring.commit(n)
+        return n
+
+    def wait_for(self, byte=PROMPT, timeout=PROMPT_TIMEOUT):
+        """
+        byte 가 수신될 때까지 읽는다. 리턴: byte 다음 오프셋 (응답 끝), 제한 시간 안에 없으면 -1.
+        이미 확인한 구간은 다시 스캔하지 않는다.
+        """
+        ring = self.ring
+        deadline = time.monotonic() + timeout
+        while True:
+            i = ring.find(byte, ring.scan)
+            if i >= 0:
+                ring.scan = i + 1
+                return i + 1
+            ring.scan = ring.tail
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return -1
+            self.fill(remaining)
+
+    def exchange(self, data, timeout=PROMPT_TIMEOUT):
+        """
+        payload 를 보내고 프롬프트까지의 응답을 받아 버퍼에서 버린다.
+        리턴: 응답 길이, 프롬프트가 오지 않으면 -1.
+        """
+        self.write(data)
+        end = self.wait_for(PROMPT, timeout)
+        if end < 0:
+            return -1
+        n = end - self.ring.head
+        self.ring.consume(n)
+        return n
+
+    def discard(self):
+        """이미 도착한 입력을 블로킹 없이 읽어서 버린다. 리턴: 버린 바이트 수."""
+        total = 0
+        while True:
+            n = self.fill(0)
+            if not n:
+                break
+            total += n
+            self.ring.clear()
+        self.ring.clear()
+        return total
+
+    def reset(self):
+        """포트 입력 버퍼와 원형 버퍼를 함께 비운다."""
+        self.ser.reset_input_buffer()
+        self.ring.clear()
+
+    def take_text(self):
+        """버퍼에 쌓인 내용을 문자열로 꺼낸다 (화면 출력용, 여기서만 복사)."""
+        text = "".join(bytes(v).decode(errors="ignore")
+                       for v in self.ring.views(self.ring.head, self.ring.tail))
+        self.ring.clear()
+        return text
+
+    def iter_blocks(self, timeout=PROMPT_TIMEOUT):
+        """
+        콘솔 캡처용. 완성된 줄들(마지막 '\\n' 까지)을 (memoryview 튜플(1~2 개), 줄 수) 로
+        yield 하고 다음 반복에서 버퍼에서 소비한다. 줄마다가 아니라 읽은 만큼 한 번에 넘기므로
+        호출자는 f.write(view) 처럼 복사 없이 흘려보낼 수 있다 (view 는 다음 반복 전까지만 유효).
+        timeout 동안 새 줄이 없으면 끝난다.
+        """
+        ring = self.ring
+        while True:
+            if self.wait_for(NEWLINE, timeout) < 0:
+                return
+            end = ring.rfind(NEWLINE, ring.scan) + 1 or ring.scan
+            ring.scan = end
+            yield ring.views(ring.head, end), ring.count(NEWLINE, ring.head, end)
+            ring.consume(end - ring.head)
+
+_handles = weakref.WeakKeyDictionary()
+
+def get(ser):
+    """포트별 SerialIO (처음 호출 때 만들고 이후 재사용)."""
+    io = _handles.get(ser)
+    if io is None:
+        io = _handles[ser] = SerialIO(ser)
+    return io
+
+# ————— Benchmark —————
+def _stand_in(master, chunk_lines=0):
+    """
+    pty master 쪽 가짜 Numato: "\\r" 로 끝나는 명령마다 echo + "\\n\\r>" 응답.
+    chunk_lines > 0 이면 명령 대신 콘솔 로그 줄을 계속 쏟아낸다.
+    """
+    if chunk_lines:
+        line = b"[    1.234567] console: booting, dummy log line for capture benchmark\r\n"
+        block = line * chunk_lines
+        try:
+            while True:
+                os.write(master, block)
+        except OSError:
+            return
+    buf = b""
+    while True:
+        try:
+            data = os.read(master, 1024)
+        except OSError:
+            return
+        if not data:
+            return
+        buf += data
+        while b"\r" in buf:
+            line, buf = buf.split(b"\r", 1)
+            os.write(master, line + b"\n\r>")
+
+def _spawn(chunk_lines=0):
+    """
+    가짜 보드를 자식 프로세스에서 실행 (그쪽 할당은 측정에서 빠지도록).
+    리턴: (pid, slave 경로, slave fd). slave fd 는 측정이 끝난 뒤 호출한 쪽에서 닫는다.
+    """
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    name = os.ttyname(slave)
+    pid = os.fork()
+    if pid == 0:
+        os.close(slave)
+        _stand_in(master, chunk_lines)
+        os._exit(0)
+    os.close(master)
+    return pid, name, slave
+
+def _legacy_exchange(ser, cmd):
+    """serial_io 이전의 exchange 방식 (명령마다 encode, 응답을 bytes 로 이어 붙임)."""
+    ser.write((cmd + "\r").encode())
+    buf = b""
+    deadline = time.monotonic() + PROMPT_TIMEOUT
+    while time.monotonic() < deadline:
+        buf += ser.read(ser.in_waiting or 1)
+        if buf.rstrip().endswith(b">"):
+            return buf
+    raise TimeoutError(cmd)
+
+def _rate(fn, n):
+    fn()    # 첫 호출의 1회성 할당(캐시, 핸들 생성)은 제외
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - t0)
+
+def _allocs(fn, n):
+    """호출 1회마다 tracemalloc peak 증가분(순간 할당 바이트)의 평균과, n 회 뒤 남은 바이트/회."""
+    import tracemalloc
+    fn()
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    transient = 0
+    for _ in range(n):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        transient += tracemalloc.get_traced_memory()[1] - before
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return transient / n, retained / n
+
+def benchmark(n=2000, console_bytes=8 << 20):
+    results = []
+    pid, name, slave = _spawn()
+    try:
+        with serial.Serial(name, 115200, timeout=0.05) as ser:
+            cmds = ["gpio iomask 8f", "gpio writeall 82"]
+            payloads = [payload(c) for c in cmds]
+            io = get(ser)
+            state = {"i": 0}
+
+            def legacy():
+                state["i"] += 1
+                _legacy_exchange(ser, cmds[state["i"] & 1])
+
+            def ring():
+                state["i"] += 1
+                if io.exchange(payloads[state["i"] & 1]) < 0:
+                    raise TimeoutError(cmds[state["i"] & 1])
+
+            for label, fn in (("legacy", legacy), ("serial_io", ring)):
+                rate = _rate(fn, n)
+                transient, retained = _allocs(fn, min(n, 500))
+                results.append(f"  {label:<10} {rate:9.0f} cmd/s   alloc {transient:6.1f} B/cmd "
+                               f"(retained {retained:.2f})")
+    finally:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        os.close(slave)
+
+    pid, name, slave = _spawn(chunk_lines=64)
+    try:
+        with serial.Serial(name, 115200, timeout=0.05) as ser:
+            def legacy_capture():
+                got, lines, pending = 0, 0, b""
+                while got < console_bytes:
+                    data = ser.read(ser.in_waiting or 1)
+                    got += len(data)
+                    pending += data
+                    *done, pending = pending.split(b"\n")
+                    lines += len(done)
+                return lines
+
+            io = SerialIO(ser, size=64 << 10)
+
+            def ring_capture():
+                got = lines = 0
+                for views, nl in io.iter_blocks():
+                    lines += nl
+                    got += sum(len(v) for v in views)
+                    if got >= console_bytes:
+                        break
+                return lines
+
+            for label, fn in (("legacy", legacy_capture), ("serial_io", ring_capture)):
+                ser.reset_input_buffer()
+                rate = _rate(fn, 1) * console_bytes
+                transient, _ = _allocs(fn, 1)
+                results.append(f"  {label:<10} {rate / 1e6:9.1f} MB/s    alloc {transient / 1024:6.1f} KiB peak "
+                               f"(console capture)")
+    finally:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+        os.close(slave)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ring-buffer serial I/O against a pty stand-in")
+    parser.add_argument("-n", type=int, default=2000, help="commands per variant")
+    parser.add_argument("--console-mb", type=int, default=8, help="console capture size (MiB)")
+    args = parser.parse_args()
+    print(f"GPIO exchange x{args.n}, console capture {args.console_mb} MiB")
+    print("\n".join(benchmark(args.n, args.console_mb << 20)))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import socket
+import statistics
+import sys
+import threading
+import time
+
+# ————— Configuration —————
+USBIP_PORT     = 3240   # usbipd 기본 포트
+PROBE_SAMPLES  = 5      # 서버당 TCP connect 샘플 수
+PROBE_TIMEOUT  = 1.0    # connect 1회당 타임아웃 (초)
+PROBE_INTERVAL = 0.05   # 샘플 간 간격 (초)
+JITTER_WEIGHT  = 2.0    # 점수 계산 시 jitter 가중치
+LOSS_PENALTY   = 1000.0 # 실패 샘플 1개당 점수 패널티 (ms)
+
+def measure_link(host, port=USBIP_PORT, samples=PROBE_SAMPLES,
+                 timeout=PROBE_TIMEOUT, interval=PROBE_INTERVAL):
+    """
+    host:port 로 TCP connect 를 samples 번 시도해 링크 품질을 측정.
+    리턴: {"host", "rtt_ms", "jitter_ms", "loss", "score"}
+      - rtt_ms   : 성공 샘플의 중앙값 (전부 실패하면 None)
+      - jitter_ms: 연속 샘플 간 RTT 차이의 평균 (RFC 3550 방식과 유사)
+      - loss     : 실패 샘플 비율 (0.0 ~ 1.0)
+      - score    : 낮을수록 좋음 (전부 실패하면 None)
+    """
+    rtts = []
+    failures = 0
+    for i in range(samples):
+        t0 = time.perf_counter()
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                pass
+            rtts.append((time.perf_counter() - t0) * 1000.0)
+        except OSError:
+            failures += 1
+        if i + 1 < samples:
+            time.sleep(interval)
+
+    if not rtts:
+        return {"host": host, "rtt_ms": None, "jitter_ms": None,
+                "loss": 1.0, "score": None}
+
+    rtt = statistics.median(rtts)
+    diffs = [abs(b - a) for a, b in zip(rtts, rtts[1:])]
+    jitter = sum(diffs) / len(diffs) if diffs else 0.0
+    loss = failures / samples
+    return {"host": host, "rtt_ms": rtt, "jitter_ms": jitter,
+            "loss": loss, "score": link_score(rtt, jitter, failures)}
+
+def link_score(rtt_ms, jitter_ms, failures=0):
+    """RTT + 가중 jitter + 손실 패널티. 낮을수록 좋은 서버."""
+    return rtt_ms + JITTER_WEIGHT * jitter_ms + LOSS_PENALTY * failures
+
+def measure_links(hosts, port=USBIP_PORT, samples=PROBE_SAMPLES,
+                  timeout=PROBE_TIMEOUT):
+    """
+    모든 서버를 동시에 측정 (서버마다 스레드 1개).
+    리턴: {host: measure_link 결과}
+    """
+    results = {}
+    def worker(h):
+        results[h] = measure_link(h, port, samples, timeout)
+
+    # 스레드 이름은 trace 기록/재실행에서 호출을 나누는 키
+    threads = [threading.Thread(target=worker, args=(h,), name=f"probe:{h}", daemon=True)
+               for h in hosts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def format_link(link):
+    """메뉴 출력용 짧은 문자열."""
+    if not link or link["rtt_ms"] is None:
+        return "rtt -- (unreachable)"
+    return (f"rtt {link['rtt_ms']:.1f}ms ±{link['jitter_ms']:.1f} "
+            f"score {link['score']:.1f}")
+
+def pick_best(servers, statuses, links):
+    """
+    free 상태이면서 측정에 성공한 서버 중 score 가 가장 낮은 서버를 리턴.
+    statuses 는 select_server 의 (free, holders, has_devices) 튜플 리스트.
+    후보가 없으면 None.
+    """
+    candidates = []
+    for ip, (free, _, _) in zip(servers, statuses):
+        link = links.get(ip)
+        if free and link and link["score"] is not None:
+            candidates.append((link["score"], ip))
+    if not candidates:
+        return None
+    return min(candidates)[1]
+
+if __name__ == "__main__":
+    hosts = sys.argv[1:] or ["tcremote.telechips.com", "10.10.27.132"]
+    for h, link in measure_links(hosts).items():
+        print(f"{h}: {format_link(link)} loss {link['loss']*100:.0f}%")
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+import usbip_ports
+
+# ————— Configuration —————
+STATE_DIR         = os.path.join(tempfile.gettempdir(), "usbip_sessions")
+TEARDOWN_DEADLINE = 5.0   # detach + API DELETE 전체 제한 시간 (초)
+
+# ————— State File —————
+# 프로세스마다 STATE_DIR/<pid>.json 하나. 정상 종료 시 삭제되고,
+# 비정상 종료로 남아 있으면 다음 실행 때 recover_stale() 이 정리한다.
+def state_path(pid=None):
+    return os.path.join(STATE_DIR, f"{pid or os.getpid()}.json")
+
+def _write(state):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(state["pid"])
+    # 한 프로세스의 여러 스레드가 동시에 써도 tmp 파일이 겹치지 않도록
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+def save_state(server_ip, busids, api_url=None, leased=False, lease_ids=None):
+    """
+    현재 세션(서버, attach 된 bus ID, API 할당 여부)을 상태 파일에 기록.
+    server_ip 는 서버 하나 또는 서버 리스트 (fleet).
+    lease_ids 는 API 할당의 source_ip 리스트 (생략하면 이 호스트 IP 하나).
+    """
+    state = {
+        "pid":       os.getpid(),
+        "script":    os.path.basename(sys.argv[0]),
+        "server":    server_ip,
+        "busids":    sorted(set(busids)),
+        "api_url":   api_url,
+        "client_ip": socket.gethostbyname(socket.gethostname()),
+        "leased":    leased,
+        "lease_ids": lease_ids,
+        "started":   time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    _write(state)
+    return state
+
+def set_leased(state):
+    """API 에 할당을 보고하기 직전에 호출 (보고 도중 죽어도 다음 실행이 DELETE 하도록)."""
+    if state is None or state.get("leased"):
+        return
+    state["leased"] = True
+    _write(state)
+
+def add_busid(state, busid):
+    """watchdog 등이 새로 attach 한 bus ID 를 상태 파일에 반영."""
+    if state is None or busid in state["busids"]:
+        return
+    state["busids"] = sorted(set(state["busids"]) | {busid})
+    _write(state)
+
+def clear_state(pid=None):
+    try:
+        os.remove(state_path(pid))
+    except OSError:
+        pass
+
+def load_states():
+    states = []
+    try:
+        names = os.listdir(STATE_DIR)
+    except OSError:
+        return states
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(STATE_DIR, name), encoding="utf-8") as f:
+                states.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return states
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+# ————— Teardown —————
+def _in_use_ports():
+    """
+    사용 중인 USB/IP 포트의 (port, server, busid) 목록 (usbip_ports 스냅샷 공유).
+    `usbip port` 가 실패하면 None.
+    """
+    ports = usbip_ports.in_use_ports()
+    if ports is None:
+        return None
+    return [(r.port, r.server, r.busid) for r in ports]
+
+def same_host(a, b):
+    """호스트 이름/IP 표기가 달라도 같은 서버인지 비교."""
+    if a == b:
+        return True
+    try:
+        return socket.gethostbyname(a) == socket.gethostbyname(b)
+    except (OSError, TypeError):
+        return False
+
+def teardown(state, deadline=TEARDOWN_DEADLINE, all_ports=False, log=print):
+    """
+    세션의 USB/IP 포트 detach 와 API 할당 해제(DELETE)를 동시에 실행하고
+    deadline 초 안에 끝나지 않은 작업은 기다리지 않고 넘어간다.
+    all_ports=True 면 사용 중인 포트를 모두 detach,
+    아니면 상태 파일의 서버/bus ID 와 일치하는 포트만 detach 한다
+    (state 가 None 이면 detach 할 포트 없음).
+    리턴: 제한 시간 안에 끝나지 않은 작업 이름 리스트
+    """
+    end = time.monotonic() + deadline
+    ports = _in_use_ports() if all_ports or state else []
+    if ports is None:
+        ports = _in_use_ports()   # 한 번 더 (일시적인 실패로 포트를 남기지 않도록)
+    if ports is None:
+        log("[TEARDOWN] usbip port failed, no ports detached")
+        ports = []
+    if not all_ports and state:
+        own = set(state.get("busids", []))
+        # fleet 처럼 한 프로세스가 여러 서버를 쓰면 "server" 가 리스트
+        servers = state.get("server")
+        servers = servers if isinstance(servers, list) else [servers]
+        ports = [p for p in ports
+                 if p[2] in own and any(same_host(p[1], sv) for sv in servers)]
+
+    def detach(port):
+        try:
+            subprocess.run(
+                ["usbip","detach","-p",port],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                timeout=max(end - time.monotonic(), 0.1)
+            )
+            log(f"[DETACH] Port {port} detached")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            log(f"[DETACH] Port {port} failed: {e}")
+
+    def release(lease_id):
+        url = f"{state['api_url']}/{quote(lease_id, safe='')}"
+        try:
+            d = requests.delete(url, timeout=max(end - time.monotonic(), 0.1))
+            d.raise_for_status()
+            log(f"[REPORT] DELETE OK → {lease_id}")
+        except Exception as e:
+            log(f"[REPORT] DELETE FAIL → {e}")
+
+    jobs = [(f"detach:{p[0]}", detach, (p[0],)) for p in ports]
+    if state and state.get("leased") and state.get("api_url"):
+        for lease_id in state.get("lease_ids") or [state["client_ip"]]:
+            jobs.append((f"api-delete:{lease_id}", release, (lease_id,)))
+
+    threads = []
+    for name, fn, args in jobs:
+        t = threading.Thread(target=fn, args=args, name=name, daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join(max(end - time.monotonic(), 0))
+    if ports:
+        usbip_ports.invalidate()
+
+    pending = [t.name for t in threads if t.is_alive()]
+    if pending:
+        log(f"[TEARDOWN] Deadline {deadline}s exceeded, abandoned: {pending}")
+    if state:
+        clear_state(state["pid"])
+    return pending
+
+def recover_stale(deadline=TEARDOWN_DEADLINE, log=print):
+    """
+    이전 실행이 비정상 종료하면서 남긴 세션(프로세스가 없는 상태 파일)을 정리.
+    남아 있는 포트 detach + API 할당 해제 후 상태 파일을 지운다.
+    """
+    recovered = []
+    for state in load_states():
+        pid = state.get("pid")
+        if pid == os.getpid() or (pid and _pid_alive(pid)):
+            continue
+        log(f"[RECOVER] Stale session pid {pid} → {state.get('server')} {state.get('busids')}")
+        teardown(state, deadline=deadline, log=log)
+        recovered.append(state)
+    return recovered
+
+if __name__ == "__main__":
+    states = load_states()
+    if not states:
+        print("No recorded sessions.")
+    for st in states:
+        alive = "alive" if _pid_alive(st["pid"]) else "stale"
+        print(f"pid {st['pid']} ({st['script']}, {alive}): {st['server']} {st['busids']}")
+    if "--recover" in sys.argv:
+        recover_stale()
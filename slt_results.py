@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+
+# ————— Record Format —————
+# 파일 = 16바이트 헤더 + 고정 길이 레코드의 나열 (append-only)
+#   header : magic(4s) version(H) record_size(H) created(d)
+#   record : cycle(I) start_ts(d) on_s(f) off_s(f) switch_ms(f)
+#            attached(B) outcome(B) reserved(H)
+MAGIC        = b"SLTR"
+VERSION      = 1
+HEADER       = struct.Struct("<4sHHd")
+RECORD       = struct.Struct("<IdfffBBH")
+RECORD_FIELDS = ("cycle", "start_ts", "on_s", "off_s", "switch_ms",
+                 "attached", "outcome")
+
+# outcome 코드
+OK          = 0
+SERIAL_FAIL = 1   # GPIO 시퀀스 전송 실패
+DETACHED    = 2   # 사이클 중 USB/IP 디바이스가 떨어짐
+OUTCOMES    = {OK: "ok", SERIAL_FAIL: "serial_fail", DETACHED: "detached"}
+
+# 누적 통계에 쓰는 로그 스케일 히스토그램 (1ms ~ 10000s, 구간당 약 5%)
+HIST_MIN     = 1e-3
+HIST_MAX     = 1e4
+HIST_BUCKETS = 330
+_LOG_MIN     = math.log(HIST_MIN)
+_LOG_STEP    = (math.log(HIST_MAX) - _LOG_MIN) / HIST_BUCKETS
+
+class RunningStats:
+    """
+    고정 크기 히스토그램 기반 누적 통계.
+    사이클 수와 무관하게 메모리 사용량이 일정하며, 백분위 오차는 구간 폭(~5%) 이내.
+    """
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * HIST_BUCKETS))
+        self.n = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if value <= HIST_MIN:
+            idx = 0
+        else:
+            idx = int((math.log(value) - _LOG_MIN) / _LOG_STEP)
+        self.counts[min(max(idx, 0), HIST_BUCKETS - 1)] += 1
+
+    def percentile(self, p):
+        if not self.n:
+            return None
+        rank = math.ceil(self.n * p / 100.0)
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                # 구간의 기하 중앙값, 실측 min/max 범위로 보정
+                mid = math.exp(_LOG_MIN + (idx + 0.5) * _LOG_STEP)
+                return min(max(mid, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.n,
+            "mean":  self.total / self.n if self.n else None,
+            "min":   self.min,
+            "p50":   self.percentile(50),
+            "p90":   self.percentile(90),
+            "p99":   self.percentile(99),
+            "max":   self.max,
+        }
+
+class ResultSummary:
+    """
+    결과 레코드의 누적 통계(백분위, 실패 횟수). 파일은 읽기만 한다.
+    """
+    METRICS = ("on_s", "off_s", "switch_ms")
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = {m: RunningStats() for m in self.METRICS}
+        self.failures = {code: 0 for code in OUTCOMES}
+        self.cycles = 0
+        self.last_cycle = 0
+
+    @classmethod
+    def load(cls, path):
+        """기존 결과 파일을 iter_records 로 읽어서 요약 (파일은 수정하지 않음)."""
+        summary = cls(path)
+        for rec in iter_records(path):
+            summary._account(rec)
+        return summary
+
+    def _account(self, rec):
+        self.cycles += 1
+        self.last_cycle = max(self.last_cycle, rec["cycle"])
+        self.failures[rec["outcome"]] = self.failures.get(rec["outcome"], 0) + 1
+        for m in self.METRICS:
+            self.stats[m].add(rec[m])
+
+    def summary(self):
+        failed = self.cycles - self.failures.get(OK, 0)
+        return {
+            "file":         self.path,
+            "cycles":       self.cycles,
+            "failed":       failed,
+            "failure_rate": failed / self.cycles if self.cycles else 0.0,
+            "outcomes":     {OUTCOMES.get(c, str(c)): n for c, n in self.failures.items()},
+            "metrics":      {m: s.summary() for m, s in self.stats.items()},
+        }
+
+    def export_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["metric", "count", "mean", "min", "p50", "p90", "p99", "max"])
+            for m, s in self.summary()["metrics"].items():
+                w.writerow([m] + [s[k] for k in ("count", "mean", "min",
+                                                 "p50", "p90", "p99", "max")])
+
+class ResultStore(ResultSummary):
+    """
+    사이클 결과를 고정 길이 바이너리 레코드로 파일에 append 하고
+    동시에 누적 통계(백분위, 실패 횟수)를 갱신한다.
+    이미 결과가 있는 파일은 append=True 일 때만 이어 쓴다 (중단된 캠페인 재개용,
+    사이클 번호는 last_cycle 다음부터). 아니면 FileExistsError.
+    """
+    def __init__(self, path, append=False):
+        super().__init__(path)
+        self._buf = bytearray(RECORD.size)
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new and not append:
+            raise FileExistsError(f"{path}: already has results (append to resume it)")
+        if not new:
+            _check_header(path)
+            # 덜 쓰인 마지막 레코드가 있으면 잘라내서 레코드 경계를 맞춘다
+            n = (os.path.getsize(path) - HEADER.size) // RECORD.size
+            os.truncate(path, HEADER.size + n * RECORD.size)
+            # 기존 파일에 이어 쓰는 경우 통계도 이어서 누적
+            for rec in iter_records(path):
+                self._account(rec)
+        self._f = open(path, "ab")
+        if new:
+            self._f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, time.time()))
+            self._f.flush()
+
+    def record(self, cycle, start_ts, on_s, off_s, switch_ms, attached, outcome=OK):
+        RECORD.pack_into(self._buf, 0, cycle, start_ts, on_s, off_s, switch_ms,
+                         attached, outcome, 0)
+        self._f.write(self._buf)
+        self._f.flush()
+        self._account(dict(zip(RECORD_FIELDS, (cycle, start_ts, on_s, off_s,
+                                               switch_ms, attached, outcome))))
+
+    def close(self):
+        self._f.close()
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        head = f.read(HEADER.size)
+    if len(head) < HEADER.size:
+        raise ValueError(f"{path}: not an SLT result file (v{VERSION})")
+    magic, version, size, _ = HEADER.unpack(head)
+    if magic != MAGIC or size != RECORD.size:
+        raise ValueError(f"{path}: not an SLT result file (v{VERSION})")
+
+def iter_records(path):
+    """
+    mmap 으로 결과 파일을 읽어 레코드를 dict 로 하나씩 리턴.
+    마지막 레코드가 덜 쓰인 경우(중단된 실행) 해당 레코드는 무시한다.
+    """
+    _check_header(path)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        n = (size - HEADER.size) // RECORD.size
+        if n <= 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(n):
+                values = RECORD.unpack_from(mm, HEADER.size + i * RECORD.size)
+                yield dict(zip(RECORD_FIELDS, values[:-1]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize an SLT result file")
+    parser.add_argument("path")
+    parser.add_argument("--json", help="write summary JSON to this path")
+    parser.add_argument("--csv", help="write per-metric summary CSV to this path")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path}: no such file")
+
+    try:
+        summary = ResultSummary.load(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.json:
+        summary.export_json(args.json)
+    if args.csv:
+        summary.export_csv(args.csv)
+    print(json.dumps(summary.summary(), indent=2))
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+실제 세션의 외부 I/O(usbip 서브프로세스, 시리얼, API, TCP connect, 콘솔 입력)를 기록하고,
+기록을 그대로 다시 먹여서 스크립트의 실제 함수들을 가상 시계로 빠르게 재실행한다.
+
+  python SLT_AutoONOFF.py --record slt.trace      # 실제 장비로 1회 실행하며 기록
+  python SLT_AutoONOFF.py --replay slt.trace      # 장비 없이 수 초 만에 재실행
+
+재실행 중에는 time.sleep / time.monotonic / time.time 이 가상 시계로 바뀌어
+sleep(60) 은 즉시 리턴하고 시계만 60초 앞으로 간다.
+TCP 는 connect 성공/실패만 기록하므로(server_probe 용) gpio_agent transport 세션은
+재실행 대상이 아니다.
+
+각 기록에는 호출한 스레드 이름이 남는다. 재실행에서는 스레드별로 기록을 나눠 주되
+기록된 전체 순서를 지키도록 차례를 기다리게 하고, 시계도 스레드별로 기록 시각(t)에
+맞춰 전진시킨다. 그래서 watchdog 처럼 sleep(1) 마다 도는 스레드도 기록과 같은 횟수,
+같은 순서로 메인 스레드와 섞여 돈다. 스레드 이름이 실행마다 같아야 하므로 (watchdog,
+detach:00 ...) 기록 대상 스레드는 이름을 붙여서 만든다.
+
+재실행이 기록과 다르게 흘러가면(기록에 없는 호출, 차례가 오지 않는 호출, 또는 쓰이지
+않고 남은 기록) replay() 는 종료 코드 1 을 리턴한다. 메인 스레드가 끝난 뒤 다른 스레드가
+기록 끝에 닿는 것은 기록이 거기서 끝났기 때문이므로 divergence 로 치지 않는다.
+"""
+import builtins
+import json
+import socket
+import subprocess
+import threading
+import time
+from collections import defaultdict, deque
+
+import requests
+import serial
+
+class TraceExhausted(BaseException):
+    """
+    재실행 중 기록에 없는 호출이 들어온 경우 (기록 끝, 또는 제어 흐름이 바뀜).
+    스크립트의 `except Exception` 에 잡혀 묻히지 않도록 BaseException 에서 파생.
+    """
+
+TURN_TIMEOUT = 5.0    # 재실행에서 자기 차례를 기다리는 실제 시간 한도 (초)
+
+_real_monotonic = time.monotonic
+
+def _key(kind, *parts):
+    return json.dumps([kind] + [list(p) if isinstance(p, tuple) else p for p in parts])
+
+# ————— Virtual Clock —————
+class VirtualClock:
+    """
+    sleep 은 즉시 리턴하고 시각만 전진시키는 단조 시계. 시각은 스레드마다 따로 가고
+    (다른 스레드의 sleep 이 섞이지 않도록), 새 스레드는 지금까지의 최대 시각에서 시작한다.
+    읽을 때마다 tick 만큼 전진해서 deadline 까지 busy-wait 하는 루프도 끝난다.
+    """
+    def __init__(self, start=0.0, wall=None, tick=1e-6):
+        self.latest = start
+        self.wall0 = time.time() if wall is None else wall
+        self.tick = tick
+        self.lock = threading.Lock()
+        self._local = threading.local()
+
+    def _advance(self, to=None, by=0.0):
+        with self.lock:
+            now = getattr(self._local, "now", self.latest)
+            now = max(now, to) if to is not None else now + by
+            self._local.now = now
+            self.latest = max(self.latest, now)
+            return now
+
+    def reach(self, t):
+        """이 스레드의 시각을 적어도 t 로 (기록된 호출 시각에 맞춤)."""
+        self._advance(to=t)
+
+    def sleep(self, secs):
+        self._advance(by=max(secs, 0))
+
+    def monotonic(self):
+        return self._advance(by=self.tick)
+
+    def time(self):
+        return self.wall0 + self.monotonic()
+
+# ————— Patching —————
+class _Patcher:
+    """모듈 속성을 바꿔 끼우고 종료 시 원래대로 돌려놓는다."""
+    def __init__(self):
+        self._saved = []
+
+    def patch(self, obj, name, value):
+        self._saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def restore(self):
+        for obj, name, value in reversed(self._saved):
+            setattr(obj, name, value)
+        self._saved.clear()
+
+def _as_text(v):
+    return v.decode(errors="replace") if isinstance(v, bytes) else v
+
+# ————— Record —————
+class _RecordingSerial:
+    """실제 serial.Serial 을 감싸 write / read 계열 호출을 기록."""
+    def __init__(self, rec, real):
+        self._rec, self._real = rec, real
+
+    def write(self, data):
+        self._rec.emit("serial.write", [self._real.port], {"data": data.hex()})
+        return self._real.write(data)
+
+    def _read(self, name, *args):
+        data = getattr(self._real, name)(*args)
+        self._rec.emit("serial." + name, [self._real.port], {"data": data.hex()})
+        return data
+
+    def read(self, size=1):
+        return self._read("read", size)
+
+    def read_all(self):
+        return self._read("read_all")
+
+    def readinto(self, b):
+        # serial_io 의 버퍼 읽기. 재실행에서는 read 와 같은 기록으로 채운다
+        n = self._real.readinto(b) or 0
+        self._rec.emit("serial.read", [self._real.port], {"data": bytes(b[:n]).hex()})
+        return n
+
+    @property
+    def in_waiting(self):
+        n = self._real.in_waiting
+        self._rec.emit("serial.in_waiting", [self._real.port], {"n": n})
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._real.close()
+
+class Recorder:
+    """
+    with Recorder(path): 블록 안의 subprocess.run / serial.Serial / socket.create_connection /
+    requests.get·post·delete / input 호출을 JSON Lines 로 기록한다.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.t0 = time.monotonic()
+        self._p = _Patcher()
+
+    def emit(self, kind, key, result):
+        line = json.dumps({"t": round(time.monotonic() - self.t0, 6),
+                           "thread": threading.current_thread().name,
+                           "kind": kind, "key": key, "result": result})
+        with self.lock:
+            if self._f is None:     # 기록이 끝난 뒤에도 도는 스레드 (watchdog 등)
+                return
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def __enter__(self):
+        self._f = open(self.path, "w", encoding="utf-8")
+        real_run = subprocess.run
+        real_serial = serial.Serial
+        real_input = builtins.input
+        real_connect = socket.create_connection
+
+        def run(args, *a, **kw):
+            try:
+                res = real_run(args, *a, **kw)
+            except subprocess.CalledProcessError as e:
+                self.emit("subprocess", list(args), {"returncode": e.returncode,
+                          "stdout": _as_text(e.stdout), "stderr": _as_text(e.stderr)})
+                raise
+            except subprocess.TimeoutExpired:
+                self.emit("subprocess", list(args), {"timeout": True})
+                raise
+            self.emit("subprocess", list(args), {"returncode": res.returncode,
+                      "stdout": _as_text(res.stdout), "stderr": _as_text(res.stderr)})
+            return res
+
+        def open_serial(port, *a, **kw):
+            try:
+                s = real_serial(port, *a, **kw)
+            except Exception as e:
+                self.emit("serial.open", [port], {"error": str(e)})
+                raise
+            self.emit("serial.open", [port], {})
+            return _RecordingSerial(self, s)
+
+        def http(method):
+            real = getattr(requests, method)
+            def call(url, *a, **kw):
+                try:
+                    r = real(url, *a, **kw)
+                except Exception as e:
+                    self.emit("http", [method, url], {"error": str(e)})
+                    raise
+                self.emit("http", [method, url], {"status": r.status_code, "body": r.text})
+                return r
+            return call
+
+        def connect(address, *a, **kw):
+            try:
+                conn = real_connect(address, *a, **kw)
+            except OSError as e:
+                self.emit("connect", list(address), {"error": str(e)})
+                raise
+            self.emit("connect", list(address), {})
+            return conn
+
+        def recorded_input(prompt=""):
+            value = real_input(prompt)
+            self.emit("input", [], {"value": value})
+            return value
+
+        self._p.patch(subprocess, "run", run)
+        self._p.patch(serial, "Serial", open_serial)
+        for m in ("get", "post", "delete"):
+            self._p.patch(requests, m, http(m))
+        self._p.patch(socket, "create_connection", connect)
+        self._p.patch(builtins, "input", recorded_input)
+        return self
+
+    def __exit__(self, *exc):
+        self._p.restore()
+        with self.lock:
+            self._f.close()
+            self._f = None
+
+# ————— Replay —————
+class _FakeResponse:
+    def __init__(self, url, status, body):
+        self.url, self.status_code, self.text = url, status, body
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}")
+
+class _ReplaySocket:
+    """재실행용 connect 결과. server_probe 처럼 연결 후 바로 닫는 용도만 지원."""
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+class _ReplaySerial:
+    def __init__(self, rp, port):
+        self._rp, self.port = rp, port
+
+    @property
+    def in_waiting(self):
+        # in_waiting 기록이 아예 없는 (이전 형식) trace 에서만 0. 기록이 있는데
+        # 모자라면 다른 호출처럼 TraceExhausted (제어 흐름이 달라진 것)
+        if "serial.in_waiting" not in self._rp.kinds:
+            return 0
+        return self._rp.take("serial.in_waiting", [self.port])["n"]
+
+    def write(self, data):
+        self._rp.take("serial.write", [self.port])
+        return len(data)
+
+    def read(self, size=1):
+        return bytes.fromhex(self._rp.take("serial.read", [self.port])["data"])
+
+    def read_all(self):
+        return bytes.fromhex(self._rp.take("serial.read_all", [self.port])["data"])
+
+    def readinto(self, b):
+        data = bytes.fromhex(self._rp.take("serial.read", [self.port])["data"])
+        b[:len(data)] = data
+        return len(data)
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+class Replayer:
+    """
+    with Replayer(path) as rp: 블록 안에서 기록된 결과를 스레드+호출 종류+인자별 순서대로
+    돌려주고, time 모듈은 가상 시계(rp.clock)로 대체한다.
+    각 호출은 기록된 전체 순서에서 자기 차례가 될 때까지 기다린다 (스레드 이름이 없는
+    이전 형식 trace 는 기다리지 않고 키별 순서만 맞춘다).
+    기록이 소진되거나 차례가 오지 않으면 TraceExhausted 를 던지고 exhausted 에 남긴다.
+    블록을 빠져나온(finish) 뒤의 호출은 exhausted 에 남기지 않는다.
+    """
+    def __init__(self, path):
+        self.queues = defaultdict(deque)    # (스레드, 키) → deque[(순번, t, result)]
+        self.lock = threading.Condition()
+        self.calls = 0
+        self.exhausted = []
+        self.kinds = set()
+        self.owner = threading.current_thread().name
+        self.threaded = False
+        self.finished = False
+        self._done = []
+        self._next = 0          # 아직 쓰이지 않은 가장 앞 기록의 순번
+        self._owner_last = -1   # owner 스레드의 마지막 기록 순번
+        self._left = defaultdict(int)   # 스레드별 남은 기록 수
+        self._threads = set()
+        with open(path, encoding="utf-8") as f:
+            for seq, line in enumerate(f):
+                ev = json.loads(line)
+                thread = ev.get("thread")
+                self.threaded = self.threaded or thread is not None
+                if thread == self.owner:
+                    self._owner_last = seq
+                self.kinds.add(ev["kind"])
+                self._left[thread] += 1
+                self.queues[thread, _key(ev["kind"], *ev["key"])].append(
+                    (seq, ev.get("t", 0.0), ev["result"]))
+                self._done.append(False)
+        self.clock = VirtualClock()
+        self._p = _Patcher()
+
+    def _fail(self, msg):
+        if not self.finished:
+            self.exhausted.append(msg)
+        raise TraceExhausted(msg)
+
+    def take(self, kind, key):
+        me = threading.current_thread()
+        thread = me.name if self.threaded else None
+        k = (thread, _key(kind, *key))
+        deadline = _real_monotonic() + TURN_TIMEOUT
+        with self.lock:
+            self._threads.add(me)
+            while True:
+                if self.finished:
+                    raise TraceExhausted("replay finished")
+                q = self.queues.get(k)
+                if not q and self.threaded and thread != self.owner and not self._left[thread]:
+                    # 기록이 끝난 뒤의 호출 (기록 중에는 owner 가 먼저 끝났음).
+                    # owner 가 끝날 때까지 세워 둔다
+                    self.lock.wait()
+                    continue
+                if not q:
+                    self._fail(f"no recorded {kind} for {key}"
+                               + (f" in thread {thread}" if thread else ""))
+                if not self.threaded or q[0][0] == self._next:
+                    break
+                left = deadline - _real_monotonic()
+                if left <= 0:
+                    self._fail(f"{kind} {key} in thread {thread} never got its turn "
+                               f"(waiting for event #{self._next})")
+                self.lock.wait(left)
+            seq, t, result = q.popleft()
+            self._left[thread] -= 1
+            self._done[seq] = True
+            while self._next < len(self._done) and self._done[self._next]:
+                self._next += 1
+            self.calls += 1
+            self.lock.notify_all()
+        self.clock.reach(t)
+        return result
+
+    def remaining(self):
+        """
+        쓰이지 않은 기록 수. owner 스레드의 마지막 기록 뒤에 다른 스레드가 남긴 것은
+        기록이 끝나는 사이에 생긴 것이므로 세지 않는다.
+        """
+        if not self.threaded:
+            return sum(len(q) for q in self.queues.values())
+        return sum(1 for seq, done in enumerate(self._done)
+                   if not done and seq <= self._owner_last)
+
+    def finish(self, timeout=1.0):
+        """재실행 종료: 기다리던 스레드를 깨워 끝내고, 패치를 되돌리기 전에 잠시 기다린다."""
+        with self.lock:
+            self.finished = True
+            self.lock.notify_all()
+            threads = [t for t in self._threads if t is not threading.current_thread()]
+        end = _real_monotonic() + timeout
+        for t in threads:
+            t.join(max(end - _real_monotonic(), 0))
+
+    def __enter__(self):
+        def run(args, *a, **kw):
+            r = self.take("subprocess", list(args))
+            if r.get("timeout"):
+                raise subprocess.TimeoutExpired(args, kw.get("timeout"))
+            if kw.get("check") and r["returncode"]:
+                raise subprocess.CalledProcessError(r["returncode"], args,
+                                                    r["stdout"], r["stderr"])
+            return subprocess.CompletedProcess(args, r["returncode"],
+                                               r["stdout"], r["stderr"])
+
+        def open_serial(port, *a, **kw):
+            r = self.take("serial.open", [port])
+            if "error" in r:
+                raise serial.SerialException(r["error"])
+            return _ReplaySerial(self, port)
+
+        def http(method):
+            def call(url, *a, **kw):
+                r = self.take("http", [method, url])
+                if "error" in r:
+                    raise requests.ConnectionError(r["error"])
+                return _FakeResponse(url, r["status"], r["body"])
+            return call
+
+        def connect(address, *a, **kw):
+            r = self.take("connect", list(address))
+            if "error" in r:
+                raise ConnectionRefusedError(r["error"])
+            return _ReplaySocket()
+
+        def replay_input(prompt=""):
+            return self.take("input", [])["value"]
+
+        self._p.patch(subprocess, "run", run)
+        self._p.patch(serial, "Serial", open_serial)
+        for m in ("get", "post", "delete"):
+            self._p.patch(requests, m, http(m))
+        self._p.patch(socket, "create_connection", connect)
+        self._p.patch(builtins, "input", replay_input)
+        self._p.patch(time, "sleep", self.clock.sleep)
+        self._p.patch(time, "monotonic", self.clock.monotonic)
+        self._p.patch(time, "perf_counter", self.clock.monotonic)
+        self._p.patch(time, "time", self.clock.time)
+        real_hook = threading.excepthook
+        def excepthook(args):
+            # 재실행이 끝나 멈춘 스레드. 의미 있는 것은 이미 exhausted 에 있다
+            if not issubclass(args.exc_type, TraceExhausted):
+                real_hook(args)
+        self._p.patch(threading, "excepthook", excepthook)
+        return self
+
+    def __exit__(self, *exc):
+        self.finish()
+        self._p.restore()
+
+def summary(rp, wall_s):
+    return (f"[REPLAY] {rp.calls} calls, virtual {rp.clock.latest:.1f}s "
+            f"in {wall_s:.2f}s wall, {rp.remaining()} events unused")
+
+def replay(path, fn, *args):
+    """
+    fn(*args) 를 기록에 대해 재실행하고 요약을 출력.
+    리턴: 종료 코드. 기록에 없는 호출이 있었거나 쓰이지 않은 기록이 남으면 1,
+    아니면 fn 의 sys.exit 코드 (없으면 0).
+    """
+    t0 = time.monotonic()
+    rp = Replayer(path)
+    code = 0
+    try:
+        with rp:
+            fn(*args)
+    except TraceExhausted:
+        pass
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    print(summary(rp, time.monotonic() - t0))
+    if rp.exhausted:
+        print(f"[REPLAY] DIVERGED: {rp.exhausted[0]}")
+        return 1
+    if rp.remaining():
+        print(f"[REPLAY] DIVERGED: {rp.remaining()} recorded events were never replayed")
+        return 1
+    return code
@@ -2,6 +2,11 @@
 import serial
 import time
 import sys
+import argparse
+
+from gpio_discovery import discover, find_board
+import gpio_sequencer
+import serial_io
 
 # 지원 가능한 보드레이트 목록
 SUPPORTED_BAUDS = [115200, 9600]
@@ -22,19 +27,32 @@ USB3FWDN_COMMANDS   = ['gpio iomask 8f', 'gpio writeall 88']
 STR_MODE_COMMANDS   = ['gpio iomask c0', 'gpio writeall c0',
                        'gpio writeall 40', 'gpio writeall c0',
                        'gpio writeall 80']
+# STR 은 펄스 폭이 중요하므로 deadline 기반으로 실행. 이 도구의 펄스 폭(DELAY)을 유지하고,
+# --sequences 파일에 STR_MODE 가 있으면 그것을 쓴다
+STR_MODE_STEPS      = gpio_sequencer.with_hold(STR_MODE_COMMANDS, DELAY)
 
 def send_and_print(ser, cmd):
-    ser.write((cmd + '\r').encode())
+    io = serial_io.get(ser)
+    io.write(serial_io.payload(cmd))
     time.sleep(DELAY)
-    resp = ser.read_all().decode(errors='ignore').strip()
+    while io.fill(0):
+        pass
+    resp = io.take_text().strip()
     print(f"> {cmd}")
     print(f"< {resp or '(no response)'}\n")
 
 def run_sequence_silent(ser, seq, mode_name):
+    io = serial_io.get(ser)
     for cmd in seq:
-        ser.write((cmd + '\r').encode())
+        io.write(serial_io.payload(cmd))
         time.sleep(DELAY)
-        ser.read_all()
+        io.discard()
+    print(f"[OK] {mode_name} sequence completed\n")
+
+def run_sequence_timed(ser, steps, mode_name):
+    """(명령, hold) 시퀀스를 gpio_sequencer 로 deadline 기반 실행하고 edge 별 jitter 를 출력."""
+    report = gpio_sequencer.run_timed(ser, steps)
+    print(gpio_sequencer.format_report(mode_name, report))
     print(f"[OK] {mode_name} sequence completed\n")
 
 def get_baud():
@@ -53,15 +71,37 @@ def get_baud():
     return b
 
 def main():
+    global STR_MODE_STEPS
+    parser = argparse.ArgumentParser(description="Numato USB GPIO CLI control")
+    parser.add_argument("--board", metavar="ID", help="open the board with this ID (no prompts)")
+    parser.add_argument("--list", action="store_true", help="list detected boards and exit")
+    parser.add_argument("--sequences", metavar="FILE",
+                        help="JSON file of timed GPIO sequences ({name: [[cmd, hold_s], ...]})")
+    args = parser.parse_args()
+    if args.sequences and "STR_MODE" in gpio_sequencer.load_sequences(args.sequences):
+        STR_MODE_STEPS = gpio_sequencer.SEQUENCES["STR_MODE"]
+
     print("=== Numato USB GPIO CLI Control ===")
-    port = input("Serial (ex: COM3, /dev/ttyUSB0): ").strip()
-    if not port:
-        print("input port.")
-        sys.exit(1)
-    baud = get_baud()
+    if args.list:
+        for board_id, info in sorted(discover().items()):
+            print(f"{board_id}: {info['port']}@{info['baud']} (ver {info['version']})")
+        sys.exit(0)
+
+    if args.board:
+        found = find_board(args.board)
+        if not found:
+            print(f"[ERROR] Board {args.board} not found")
+            sys.exit(1)
+        port, baud = found
+    else:
+        port = input("Serial (ex: COM3, /dev/ttyUSB0): ").strip()
+        if not port:
+            print("input port.")
+            sys.exit(1)
+        baud = get_baud()
 
     try:
-        ser = serial.Serial(port, baudrate=baud, timeout=1, write_timeout=1)
+        ser = serial.Serial(port, baudrate=baud, timeout=1, write_timeout=1, exclusive=True)
     except Exception as e:
         print(f"[ERROR] Fail open port: {e}")
         sys.exit(1)
@@ -116,7 +156,7 @@ def main():
                 run_sequence_silent(ser, USB3FWDN_COMMANDS, "USB3.0 FWDN")
             elif choice == "9":
                 print("[MODE] STR")
-                run_sequence_silent(ser, STR_MODE_COMMANDS, "STR MODE")
+                run_sequence_timed(ser, STR_MODE_STEPS, "STR MODE")
             else:
                 print("Enter a correct number.\n")
     except KeyboardInterrupt:
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+import fcntl
+import json
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+# ————— Configuration —————
+TTL         = 0.5    # 스냅샷 재사용 시간 (초)
+CMD_TIMEOUT = 3.0    # `usbip port` 1회 제한 (초)
+# 같은 호스트의 다른 프로세스와 공유하는 캐시 (None 이면 프로세스 내부 캐시만 사용)
+CACHE_FILE  = os.path.join(tempfile.gettempdir(), "usbip_port.cache")
+
+# `usbip port` 의 포트 하나
+#   port        : vhci 포트 번호 ("00")         status      : "Port in Use" 등
+#   speed       : "High Speed(480Mbps)"         server      : 원격 서버 호스트
+#   server_port : usbipd 포트 (3240)            busid       : 서버측 bus ID ("1-1.2")
+#   local_busid : 로컬에 붙은 bus ID ("3-1")    vid_pid     : "2a19:0800"
+PortRecord = namedtuple("PortRecord", "port status speed server server_port "
+                                      "busid local_busid vid_pid")
+
+_PORT_RE = re.compile(r"Port (\d+): <([^>]+)>(?: at (.+))?")
+_URL_RE  = re.compile(r"(\S+)\s+->\s+usbip://([^/:\s]+)(?::(\d+))?/([\d\-\.]+)")
+_IDS_RE  = re.compile(r"\(([0-9a-fA-F]{4}:[0-9a-fA-F]{4})\)")
+
+def parse(out):
+    """`usbip port` 출력 → PortRecord 튜플."""
+    records = []
+    for block in re.split(r"\n(?=Port \d+:)", out):
+        m = _PORT_RE.search(block)
+        if not m:
+            continue
+        u = _URL_RE.search(block)
+        ids = _IDS_RE.search(block)
+        records.append(PortRecord(
+            port=m.group(1),
+            status=m.group(2),
+            speed=m.group(3).strip() if m.group(3) else None,
+            server=u.group(2) if u else None,
+            server_port=int(u.group(3)) if u and u.group(3) else None,
+            busid=u.group(4) if u else None,
+            local_busid=u.group(1) if u else None,
+            vid_pid=ids.group(1).lower() if ids else None,
+        ))
+    return tuple(records)
+
+# ————— Snapshot Service —————
+_cond     = threading.Condition()
+_cache    = None      # (monotonic 시각, records)
+_rounds   = 0         # 새로 고침(성공/실패)이 끝날 때마다 증가
+_last     = None      # 마지막 새로 고침 결과 (실패면 None). 기다리던 스레드에 그대로 전달
+_last_gen = 0         # _last 를 만든 새로 고침이 시작될 때의 _gen
+_gen      = 0         # invalidate() 마다 증가. 그 전에 시작된 새로 고침 결과는 캐시하지 않음
+_inflight = False
+_share    = True      # 진행 중인 새로 고침 결과를 다른 스레드와 나눠 받을지
+stats     = {"spawns": 0, "hits": 0, "shared": 0, "file_hits": 0}
+
+def _run():
+    """`usbip port` 의 stdout. 실행 실패, 0 이 아닌 종료 코드, 시간 초과면 None."""
+    stats["spawns"] += 1
+    try:
+        res = subprocess.run(
+            ["usbip","port"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, timeout=CMD_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return res.stdout if res.returncode == 0 else None
+
+def _refresh(max_age, gen):
+    """
+    다른 프로세스와 flock 으로 순서를 맞춰, 파일 캐시가 충분히 새로우면 그것을 쓰고
+    아니면 `usbip port` 를 한 번 실행해 파일 캐시를 갱신한다. 실패하면 None.
+    실행 중에 invalidate() 되었으면(gen 이 바뀜) 결과만 리턴하고 파일 캐시는 쓰지 않는다.
+    """
+    if not CACHE_FILE:
+        out = _run()
+        return parse(out) if out is not None else None
+    with open(CACHE_FILE + ".lock", "a") as lk:
+        fcntl.flock(lk, fcntl.LOCK_EX)
+        try:
+            with open(CACHE_FILE, encoding="utf-8") as f:
+                cached = json.load(f)
+            if time.time() - cached["time"] <= max_age:
+                stats["file_hits"] += 1
+                return parse(cached["stdout"])
+        except (OSError, ValueError, KeyError):
+            pass
+        out = _run()
+        if out is None:
+            return None
+        if gen != _gen:
+            return parse(out)
+        tmp = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"time": time.time(), "stdout": out}, f)
+        os.replace(tmp, CACHE_FILE)
+        return parse(out)
+
+def snapshot(max_age=None):
+    """
+    현재 포트 상태 (PortRecord 튜플). max_age(기본 TTL) 초 이내의 결과는 재사용하고,
+    다른 스레드가 이미 새로 고치는 중이면 그 결과를 같이 받는다.
+    `usbip port` 가 실패하거나 시간 초과면 None ("붙어 있는 것 없음" 과 구분하기 위해).
+    """
+    global _cache, _rounds, _last, _last_gen, _inflight
+    age = TTL if max_age is None else max_age
+    if not _share:
+        return _refresh(age, _gen)
+    with _cond:
+        while True:
+            if _cache is not None and time.monotonic() - _cache[0] <= age:
+                stats["hits"] += 1
+                return _cache[1]
+            if not _inflight:
+                break
+            # 진행 중인 새로 고침의 결과를 _cache 가 아니라 _last 로 받는다
+            # (그 사이 invalidate() 가 _cache 를 비울 수 있으므로).
+            # 기다리기 전에 invalidate() 를 봤다면 그보다 먼저 시작된 결과는 받지 않는다
+            rnd, gen = _rounds, _gen
+            _cond.wait()
+            if _rounds != rnd and _last_gen >= gen:
+                stats["shared"] += 1
+                return _last
+        _inflight = True
+        gen = _gen
+
+    records = None
+    try:
+        records = _refresh(age, gen)
+    finally:
+        with _cond:
+            _inflight = False
+            _last, _last_gen = records, gen
+            _rounds += 1
+            if records is not None and gen == _gen:
+                _cache = (time.monotonic(), records)
+            _cond.notify_all()
+    return records
+
+def invalidate():
+    """
+    attach / detach 직후 호출해서 다음 snapshot() 이 새 상태를 읽게 한다.
+    이미 진행 중인 새로 고침(attach 전의 출력)은 _cache 에 들어가지 않고, 파일 캐시는
+    flock 으로 다른 프로세스의 새로 고침이 끝난 뒤에 지운다.
+    """
+    global _cache, _gen
+    with _cond:
+        _cache = None
+        _gen += 1
+    if CACHE_FILE:
+        with open(CACHE_FILE + ".lock", "a") as lk:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            try:
+                os.remove(CACHE_FILE)
+            except OSError:
+                pass
+
+def disable_cache():
+    """
+    매 호출마다 그 스레드에서 `usbip port` 를 실행 (trace 기록/재실행처럼 호출 수와
+    호출한 스레드가 결정적이어야 할 때). 다른 스레드의 진행 중인 결과도 나눠 받지 않는다.
+    """
+    global TTL, CACHE_FILE, _share
+    TTL, CACHE_FILE, _share = 0, None, False
+    invalidate()
+
+# ————— Convenience —————
+def attached_busids(server=None):
+    """attach 되어 있는 서버측 bus ID 집합 (server 를 주면 그 서버 것만). 조회 실패면 None."""
+    records = snapshot()
+    if records is None:
+        return None
+    return {r.busid for r in records
+            if r.busid and (server is None or r.server == server)}
+
+def in_use_ports():
+    """사용 중인 포트의 PortRecord 리스트. 조회 실패면 None."""
+    records = snapshot()
+    if records is None:
+        return None
+    return [r for r in records if r.status == "Port in Use"]
+
+# ————— Self Test —————
+def self_test(readers=8, invalidators=2, seconds=2.0):
+    """
+    가짜 `usbip port` (가끔 실패) 로 snapshot() / invalidate() 를 동시에 돌려본다.
+    리턴: 실패 메시지 리스트 (비어 있으면 통과)
+    """
+    global _run, CACHE_FILE, _cache
+    import random
+    sample = ("Port 00: <Port in Use> at High Speed(480Mbps)\n"
+              "       Numato : GPIO (2a19:0800)\n"
+              "       3-1 -> usbip://10.0.0.1:3240/1-1\n")
+    def fake_run():
+        stats["spawns"] += 1
+        time.sleep(0.002)
+        return None if random.random() < 0.2 else sample
+
+    saved = (_run, CACHE_FILE)
+    _run, CACHE_FILE, _cache = fake_run, None, None
+    failures = []
+    end = time.monotonic() + seconds
+
+    def reader():
+        try:
+            while time.monotonic() < end:
+                r = snapshot()
+                if r is not None and [p.busid for p in r] != ["1-1"]:
+                    failures.append(f"bad snapshot {r!r}")
+                    return
+        except Exception as e:
+            failures.append(f"reader: {e!r}")
+
+    def invalidator():
+        while time.monotonic() < end:
+            invalidate()
+            time.sleep(0.0005)
+
+    threads = ([threading.Thread(target=reader) for _ in range(readers)] +
+               [threading.Thread(target=invalidator) for _ in range(invalidators)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # attach 전에 시작된 새로 고침이 attach + invalidate() 뒤에 끝나는 경우:
+    # 그 뒤의 snapshot() (기다리던 것 포함) 은 attach 된 상태를 봐야 한다
+    gate, state = threading.Event(), {"out": ""}
+    def gated_run():
+        out = state["out"]
+        gate.wait()
+        return out
+    _run, _cache = gated_run, None
+    first = threading.Thread(target=snapshot)
+    first.start()
+    while not _inflight:
+        time.sleep(0.001)
+    state["out"] = sample
+    invalidate()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(snapshot()))
+    waiter.start()
+    time.sleep(0.01)
+    gate.set()
+    first.join()
+    waiter.join()
+    for r in got + [snapshot()]:
+        if r is None or [p.busid for p in r] != ["1-1"]:
+            failures.append(f"stale snapshot after invalidate: {r!r}")
+
+    _run, CACHE_FILE = saved
+    invalidate()
+    return failures
+
+if __name__ == "__main__":
+    import sys
+    if "--self-test" in sys.argv:
+        failures = self_test()
+        for f in failures[:5]:
+            print(f"[SELFTEST] FAIL: {f}")
+        print(f"[SELFTEST] {'FAILED' if failures else 'OK'} {stats}")
+        sys.exit(1 if failures else 0)
+    records = snapshot()
+    if records is None:
+        print("usbip port failed")
+        sys.exit(1)
+    for r in records:
+        print(f"Port {r.port}: {r.status} {r.speed or ''} "
+              f"{r.local_busid or '-'} -> {r.server}:{r.server_port}/{r.busid} {r.vid_pid or ''}")
+    print(stats)